@@ -0,0 +1,55 @@
+"""Compare the offline public suffix trie with tldextract.
+
+Usage: python benchmarks/bench_normalize_url.py [n]
+
+tldextract is run with its bundled snapshot of the Public Suffix List, so
+neither method uses the network.
+
+"""
+import sys
+import timeit
+
+import tldextract
+
+from textstuff.utils import _url_host, public_suffix_list
+
+URLS = [
+    "http://www.bbc.co.uk/news/world",
+    "https://user@a.b.example.com:8080/path?q=1#frag",
+    "example.com",
+    "http://forums.news.cnn.com/",
+    "https://www.city.kawasaki.jp/",
+    "http://192.168.0.1/index.html",
+    "https://docs.python.org/3/library/re.html",
+    "http://xn--85x722f.xn--55qx5d.cn/",
+]
+
+
+def main(n=10000):
+    extract = tldextract.TLDExtract(suffix_list_urls=())
+    psl = public_suffix_list()
+
+    def with_tldextract():
+        for url in URLS:
+            result = extract(url)
+            ".".join((result.domain, result.suffix))
+
+    def with_trie():
+        for url in URLS:
+            ".".join(psl.split(_url_host(url))[1:])
+
+    for url in URLS:
+        result = extract(url)
+        expected = ".".join((result.domain, result.suffix))
+        actual = ".".join(psl.split(_url_host(url))[1:])
+        if expected != actual:
+            print(f"mismatch: {url!r}: {expected!r} != {actual!r}")
+
+    n_urls = n * len(URLS)
+    for name, func in (("tldextract", with_tldextract), ("trie", with_trie)):
+        seconds = min(timeit.repeat(func, number=n, repeat=3))
+        print(f"{name:>10}: {n_urls / seconds:12,.0f} urls/sec")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,56 @@
+"""Compare split_camel_cases with split_camel_case applied to each string.
+
+Usage: python benchmarks/bench_split_camel_case.py [n] [n_unique]
+
+The identifiers are drawn with replacement from ``n_unique`` random
+identifiers, to show the effect of caching repeated identifiers.
+
+"""
+import random
+import re
+import sys
+import timeit
+
+from textstuff.utils import LRUCache, split_camel_case, split_camel_cases
+
+# the pattern used by split_camel_case before split_camel_cases was added
+_OLD_PATTERN = r".+?(?:(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])|$)"
+
+WORDS = ["get", "set", "HTTP", "Response", "Code", "user", "ID", "parse",
+         "XML", "File", "to", "String", "is", "Valid", "URL", "handler"]
+
+
+def make_identifiers(n, n_unique, seed=0):
+    rng = random.Random(seed)
+    unique = ["".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+              for _ in range(n_unique)]
+    return [rng.choice(unique) for _ in range(n)]
+
+
+def main(n=100000, n_unique=10000):
+    identifiers = make_identifiers(n, n_unique)
+
+    def old():
+        return [[m.group(0) for m in re.finditer(_OLD_PATTERN, s)]
+                for s in identifiers]
+
+    def single():
+        return [split_camel_case(s) for s in identifiers]
+
+    def batch_uncached():
+        return split_camel_cases(identifiers, cache=LRUCache(maxsize=0))
+
+    def batch_cached():
+        return split_camel_cases(identifiers, cache=cache)
+
+    cache = LRUCache(maxsize=n_unique)
+    assert old() == single() == batch_uncached() == batch_cached()
+    for name, func in (("finditer", old), ("split_camel_case", single),
+                       ("batch", batch_uncached),
+                       ("batch, cached", batch_cached)):
+        seconds = min(timeit.repeat(func, number=1, repeat=3))
+        print(f"{name:>16}: {n / seconds:12,.0f} strings/sec")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -13,9 +13,11 @@ setup(name='textstuff',
       author_email='jeffrey.arnold@gmail.com',
       license='MIT',
       packages=['textstuff', 'textstuff.spacy'],
+      package_data={'textstuff': ['data/*.dat']},
       install_requires=[
           "email_normalize",
           "furl",
+          "numpy",
           "spacy>=1.9.0",
           "textacy",
           "tldextract"
@@ -5,12 +5,107 @@ corpora that :pkg:`gensim` functions uses as inputs.
 
 """
 
+import collections
+import collections.abc
+import hashlib
+import heapq
 import itertools
-import random
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
 
-from .utils import shuffle_iterable
+import numpy as np
 
-class ShuffledCorpus:
+from .utils import _BufferedRandom, random_generator, shuffle_iterable
+
+
+class _RandomCorpus:
+    """Base class of corpora that use random numbers.
+
+    Each iteration over the corpus (epoch) uses a new random number
+    generator derived from ``seed``, the epoch number, and the worker
+    number. So iterating again gives a different, but reproducible, result,
+    and workers with the same seed but different ``worker`` numbers use
+    independent random numbers.
+
+    Attributes
+    -----------
+    seed:
+        Seed, or NumPy random number generator. See
+        :func:`~textstuff.utils.random_generator`.
+    epoch: int
+        The number of the next iteration.
+    worker: int
+        The number of the worker using the corpus.
+
+    """
+
+    seed = None
+    epoch = 0
+    worker = 0
+
+    def _next_rng(self):
+        """Return the random number generator for the next epoch."""
+        rng = random_generator(self.seed, self.epoch, self.worker)
+        self.epoch += 1
+        return rng
+
+
+class _SizedCorpus:
+    """Base class of corpora that can have a length.
+
+    Subclasses compute their length from the length of the input corpus
+    in ``_len()``, which raises :py:class:`TypeError` if that is not
+    possible. Otherwise, subclasses that always yield the same number of
+    elements count them with ``_count()``, and the length is known after
+    the first complete iteration.
+
+    """
+
+    _length = None
+
+    def _len(self):
+        raise TypeError
+
+    def __len__(self):
+        try:
+            return self._len()
+        except TypeError:
+            pass
+        if self._length is None:
+            raise TypeError(f"{type(self).__name__} does not have a known "
+                            "length.")
+        return self._length
+
+    def __bool__(self):
+        # otherwise bool() uses __len__, which can raise TypeError
+        return True
+
+    def _count(self, iterable):
+        """Yield elements of ``iterable``, and store how many there were."""
+        if self._length is not None:
+            yield from iterable
+            return
+        n = 0
+        for el in iterable:
+            n += 1
+            yield el
+        self._length = n
+
+
+def _n_batches(n, batch_size, drop_last=False):
+    """Return the number of batches of ``n`` elements."""
+    if batch_size is None:
+        return n
+    return n // batch_size if drop_last else -(-n // batch_size)
+
+
+class ShuffledCorpus(_SizedCorpus, _RandomCorpus):
     """ Return a corpus that is a shuffled version of input iterable ``corpus``
 
     This will return the documents in ``corpus`` in a random order.
@@ -28,13 +123,22 @@ class ShuffledCorpus:
     corpus:
         A corpus as defined by :py:pkg:`~gensim`---an iterable that yields
         documents.
-    max_docs:
+    n:
         The maximum number of documents to maintain in the queue.
         A larger queue requires more memory, but also better shuffles
         the corpus.
+    seed:
+        Seed or NumPy random number generator. Each iteration uses a
+        different random order derived from it.
+    batch_size:
+        If not ``None``, yield lists of ``batch_size`` documents. If ``n``
+        is not ``None``, the corpus is shuffled in batches: the queue
+        holds ``n // batch_size`` batches of consecutive documents, and
+        each batch is shuffled when it is yielded. This is faster, but
+        documents in the same batch stay together.
 
     """  # noqa
-    def __init__(self, corpus, n=None):
+    def __init__(self, corpus, n=None, seed=None, batch_size=None):
         if n is None:
             try:
                 len(corpus)
@@ -42,6 +146,12 @@ class ShuffledCorpus:
                 msg = "If n is None, then the corpus must have a length."
                 raise ValueError(msg)
         self.corpus = corpus
+        self.n = n
+        self.seed = seed
+        self.batch_size = batch_size
+
+    def _len(self):
+        return _n_batches(len(self.corpus), self.batch_size)
 
     def __iter__(self):
         """Iterate over shuffled elements from the corpus.
@@ -49,41 +159,44 @@ class ShuffledCorpus:
         Yields
         -------
         any
-            An element from ``corpus``.
+            An element from ``corpus``, or a list of them if ``batch_size``
+            is not ``None``.
 
         """
-        it = iter(self.corpus)
-        queue = list(itertools.islice(it), self.max_docs)
-        # this could also go at the end, but this ensures that the initial
-        # order never matters, and we can sequentially iterate over the
-        # queue when finished
-        random.shuffle(queue)
-        not_empty = len(queue) >= self.max_docs
-        while not_empty:
-            i = random.randrange(self.max_docs)
-            yield queue[i]
-            try:
-                queue[i] = next(it)
-            except StopIteration:
-                # need to consume the yielded element
-                queue.pop(i)
-                not_empty = False
-        # don't need to shuffle since it is initially shuffled
-        for el in queue:
-            yield el
-            
+        yield from self._count(self._shuffle(self._next_rng()))
 
+    def _shuffle(self, rng):
+        if self.batch_size is None:
+            yield from shuffle_iterable(self.corpus, self.n, seed=rng)
+        elif self.n is None:
+            docs = list(self.corpus)
+            order = rng.permutation(len(docs)).tolist()
+            for start in range(0, len(docs), self.batch_size):
+                yield [docs[i] for i in order[start:start + self.batch_size]]
+        else:
+            batches = _batches(self.corpus, self.batch_size)
+            n_batches = max(1, self.n // self.batch_size)
+            for batch in shuffle_iterable(batches, n_batches, seed=rng):
+                yield [batch[i] for i in rng.permutation(len(batch)).tolist()]
 
 
 def _iterstep(iterable, step, start=0, repeat=None):
     repeat = repeat or step
     for i in range(repeat):
-        start = (i + start) % step
-        for el in itertools.islice(start, None, step):
-            yield el
+        yield from itertools.islice(iterable, (start + i) % step, None, step)
+
+
+def _indexstep(corpus, step, start=0, repeat=None):
+    """Like :func:`_iterstep`, but only read the selected elements."""
+    repeat = repeat or step
+    n = len(corpus)
+    chunk = step * _BATCH_SIZE
+    for i in range(repeat):
+        for k in range((start + i) % step, n, chunk):
+            yield from _slice(corpus, k, min(k + chunk, n), step)
 
 
-class SkipCorpus:
+class SkipCorpus(_SizedCorpus):
     """Return a corpus that steps through a corpora.
 
     Given an iterable corpora, ``(x_1, x_2, ...)``, step size ``step``, and repetitions ``repeat``,
@@ -94,6 +207,9 @@ class SkipCorpus:
     corpus is the same size as the input corpus but consists of ``step`` passeses through the intput corpus,
     selecting every ``step`` element, but stagged.
 
+    If the corpus supports ``len()`` and indexing, e.g. a list, array, or :class:`LineCorpus`, only the
+    selected elements are read. Otherwise, each pass iterates over the whole corpus.
+
     """  # noqa
 
     def __init__(self, corpus, step=1, repeat=None, start=0):
@@ -114,8 +230,14 @@ class SkipCorpus:
 
         """  # noqa
         self.corpus = corpus
-        self.step = min(step, 1)
-        self.repeat = repeat or step
+        self.step = max(step, 1)
+        self.repeat = repeat or self.step
+        self.start = start
+
+    def _len(self):
+        n = len(self.corpus)
+        return sum(len(range((self.start + i) % self.step, n, self.step))
+                   for i in range(self.repeat))
 
     def __iter__(self):
         """Iterate over the corpus.
@@ -126,16 +248,18 @@ class SkipCorpus:
             An element from the input ``corpus``
 
         """
-        for el in _iterstep(
-                self.corpus, self.step, start=0, repeat=self.repeat):
-            yield el
+        iterstep = _indexstep if _is_indexable(self.corpus) else _iterstep
+        yield from self._count(iterstep(self.corpus, self.step,
+                                        start=self.start, repeat=self.repeat))
 
 
-class ZipCorpus:
+class ZipCorpus(_SizedCorpus):
     """Return a corpus that interleaves elements from multiple corpora.
 
     Given iterable corpora, ``(a_1, a_2, ...), (b_1, b_2, ...), (c_1, c_2, ...), ...``,
-    this corpus yields ``a_1, b_1, c_1, ..., a_2, b_2, c_2, ...``.
+    this corpus yields ``a_1, b_1, c_1, ..., a_2, b_2, c_2, ...``. When a corpus
+    is exhausted, the remaining corpora continue to be interleaved. To mix
+    corpora in other proportions, use :class:`MixedCorpus`.
 
     """  # noqa
 
@@ -150,6 +274,9 @@ class ZipCorpus:
         """  # noqa
         self.corpora = args
 
+    def _len(self):
+        return sum(len(c) for c in self.corpora)
+
     def __iter__(self):
         """Yield elements from the corpus.
 
@@ -159,22 +286,118 @@ class ZipCorpus:
            An element from one of corpora in ``self.corpora``.
 
         """
-        for x in itertools.zip_longest(self.corpora, None):
-            # fill value is None, so ignore those
-            for el in x:
-                if el is not None:
-                    yield el
+        yield from self._count(self._interleave())
+
+    def _interleave(self):
+        n_active = len(self.corpora)
+        nexts = itertools.cycle([iter(c).__next__ for c in self.corpora])
+        while n_active:
+            try:
+                for next_ in nexts:
+                    yield next_()
+            except StopIteration:
+                # drop the exhausted corpus, which was the last one called
+                n_active -= 1
+                nexts = itertools.cycle(itertools.islice(nexts, n_active))
+
+
+_SENTINEL = object()
 
 
-class SampleCorpus:
+def _open_uniform(rng):
+    """Draw a uniform random number in the open interval (0, 1)."""
+    u = rng.random()
+    while u == 0.0:
+        u = rng.random()
+    return u
+
+
+def _is_indexable(corpus):
+    """Does a corpus have a length and support indexing by integers.
+
+    Wrappers that only support indexing when the corpus they wrap does
+    declare it with an ``indexable`` attribute.
+
+    """
+    indexable = getattr(corpus, "indexable", None)
+    if indexable is not None:
+        return indexable
+    return (hasattr(corpus, "__len__") and hasattr(corpus, "__getitem__")
+            and not isinstance(corpus, (str, bytes, collections.abc.Mapping)))
+
+
+_BATCH_SIZE = 1024
+"""Number of random numbers drawn at once."""
+
+
+def _geometric_skips(p, rng):
+    """Yield the number of failures before each success of Bernoulli trials.
+
+    Each value is a draw from a geometric distribution with success
+    probability ``p``, which is the gap between elements selected when
+    each element is independently selected with probability ``p``.
+
+    """
+    while True:
+        yield from (rng.geometric(p, _BATCH_SIZE) - 1).tolist()
+
+
+def _batches(iterable, size):
+    """Yield lists of ``size`` consecutive elements of an iterable."""
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _rebatch(chunks, size):
+    """Yield lists of ``size`` elements from an iterable of lists.
+
+    The last list may have fewer than ``size`` elements.
+
+    """
+    buffer = []
+    for chunk in chunks:
+        buffer.extend(chunk)
+        while len(buffer) >= size:
+            yield buffer[:size]
+            del buffer[:size]
+    if buffer:
+        yield buffer
+
+
+def _flatten_or_rebatch(chunks, batch_size):
+    """Yield the elements of lists, or batches of them."""
+    if batch_size is None:
+        for chunk in chunks:
+            yield from chunk
+    else:
+        yield from _rebatch(chunks, batch_size)
+
+
+class SampleCorpus(_SizedCorpus, _RandomCorpus):
     """Return a corpus randomly samples from the interable corpus.
 
     This function independently samples each element from an input corpus
     ``corpus`` with probability ``p``.
 
+    By default (``method="skip"``), rather than drawing a random number for
+    each element, the number of elements to skip until the next selected
+    element is drawn from a geometric distribution. This is much faster when
+    ``p`` is small. If the corpus has a length and supports indexing, e.g. a
+    list, array, or :class:`LineCorpus`, the selected elements are accessed
+    directly and the others are never read. With ``method="bernoulli"``
+    a random number is drawn for each element.
+
+    If ``batch_size`` is given, the corpus yields lists of ``batch_size``
+    sampled elements instead of single elements.
+
     """
 
-    def __init__(self, corpus, p=1):
+    def __init__(self, corpus, p=1, method="skip", seed=None,
+                 batch_size=None):
         """Create a new object.
 
         Parameters
@@ -183,21 +406,1216 @@ class SampleCorpus:
             An iterable, usually of the type used as a corpus in :pkg:`gensim`.
         p:
             The probability of yielding an element from ``corpus``.
+        method: str
+            Either ``"skip"`` to draw the gaps between selected elements,
+            or ``"bernoulli"`` to draw a random number for each element.
+        seed:
+            Seed or NumPy random number generator. Each iteration draws a
+            different sample derived from it.
+        batch_size: int, optional
+            If not ``None``, yield lists with this many elements.
 
         """
-        self.corpora = corpus
+        if method not in ("skip", "bernoulli"):
+            raise ValueError("method must be one of 'skip' or 'bernoulli'.")
+        self.corpus = corpus
         self.p = p
+        self.method = method
+        self.seed = seed
+        self.batch_size = batch_size
+
+    def _len(self):
+        # the size of a sample is random, unless all elements are selected
+        if self.p < 1:
+            raise TypeError
+        return _n_batches(len(self.corpus), self.batch_size)
+
+    def _sample_chunks(self, rng):
+        """Yield lists of sampled elements."""
+        if self.method == "bernoulli":
+            for chunk in _batches(self.corpus, _BATCH_SIZE):
+                yield list(itertools.compress(
+                    chunk, rng.random(len(chunk)) < self.p))
+            return
+        if self.p >= 1:
+            yield from _batches(self.corpus, _BATCH_SIZE)
+            return
+        if self.p <= 0:
+            return
+        if _is_indexable(self.corpus):
+            n = len(self.corpus)
+            start = 0
+            while start < n:
+                # indices of the next selected elements
+                idx = start - 1 + np.cumsum(rng.geometric(self.p, _BATCH_SIZE))
+                selected = idx[idx < n].tolist()
+                yield [self.corpus[i] for i in selected]
+                if len(selected) < _BATCH_SIZE:
+                    return
+                start = selected[-1] + 1
+        else:
+            it = iter(self.corpus)
+            chunk = []
+            for skip in _geometric_skips(self.p, rng):
+                el = next(itertools.islice(it, skip, None), _SENTINEL)
+                if el is _SENTINEL:
+                    break
+                chunk.append(el)
+                if len(chunk) == _BATCH_SIZE:
+                    yield chunk
+                    chunk = []
+            yield chunk
 
     def __iter__(self):
         """Iterate and randomly sample elements from the corpus.
 
+        Yields
+        -------
+        any
+            An element from ``corpus``, or a list of them if ``batch_size``
+            is not ``None``.
+
+        """
+        yield from _flatten_or_rebatch(self._sample_chunks(self._next_rng()),
+                                       self.batch_size)
+
+
+def _reservoir_sample(iterable, k, rng):
+    """Sample ``k`` elements from an iterable with Algorithm L.
+
+    Rather than drawing a random number for every element, this draws the
+    number of elements to skip before the next element is put in the
+    reservoir. See Li (1994) "Reservoir-Sampling Algorithms of Time
+    Complexity O(n(1 + log(N/n)))".
+
+    The reservoir is shuffled, since elements that are never replaced
+    would otherwise stay in the order of the iterable.
+
+    """
+    it = iter(iterable)
+    reservoir = list(itertools.islice(it, k))
+    if len(reservoir) < k or k == 0:
+        rng.shuffle(reservoir)
+        return reservoir
+    w = math.exp(math.log(_open_uniform(rng)) / k)
+    while True:
+        skip = math.floor(math.log(_open_uniform(rng)) / math.log(1 - w))
+        el = next(itertools.islice(it, skip, None), _SENTINEL)
+        if el is _SENTINEL:
+            rng.shuffle(reservoir)
+            return reservoir
+        reservoir[rng.randrange(k)] = el
+        w *= math.exp(math.log(_open_uniform(rng)) / k)
+
+
+def _weighted_reservoir_sample(iterable, k, weight, rng):
+    """Sample ``k`` elements from an iterable with weights with A-ExpJ.
+
+    Each element gets the key ``u ** (1 / w)``, and the elements with the
+    largest keys are kept. Rather than drawing a key for every element,
+    this draws the total weight to skip before the next element enters
+    the reservoir. See Efraimidis and Spirakis (2006) "Weighted random
+    sampling with a reservoir".
+
+    The sample is shuffled, since the order of the heap depends on the
+    order of the iterable.
+
+    """
+    it = iter(iterable)
+    # min-heap of (key, element number, element); the element number
+    # breaks ties so elements are never compared
+    heap = []
+    i = 0
+    for el in it:
+        w = weight(el)
+        if w < 0:
+            raise ValueError("Weights must be non-negative.")
+        if w > 0:
+            heap.append((_open_uniform(rng) ** (1 / w), i, el))
+        i += 1
+        if len(heap) == k:
+            break
+    if len(heap) < k or k == 0:
+        sample = [el for _, _, el in heap]
+        rng.shuffle(sample)
+        return sample
+    heapq.heapify(heap)
+    threshold = heap[0][0]
+    x = math.log(_open_uniform(rng)) / math.log(threshold)
+    for el in it:
+        w = weight(el)
+        if w < 0:
+            raise ValueError("Weights must be non-negative.")
+        x -= w
+        if x <= 0:
+            # key conditional on being larger than the threshold
+            t_w = threshold ** w
+            key = rng.uniform(t_w, 1) ** (1 / w)
+            heapq.heapreplace(heap, (key, i, el))
+            threshold = heap[0][0]
+            x = math.log(_open_uniform(rng)) / math.log(threshold)
+        i += 1
+    sample = [el for _, _, el in heap]
+    rng.shuffle(sample)
+    return sample
+
+
+class ReservoirCorpus(_SizedCorpus, _RandomCorpus):
+    """Return a corpus that is a random sample of ``k`` documents of a corpus.
+
+    Unlike :class:`SampleCorpus`, which yields a random number of documents,
+    this yields exactly ``k`` documents (or all documents if the corpus has
+    fewer than ``k``), sampled uniformly without replacement. It makes
+    one pass over the corpus and keeps at most ``k`` documents in memory.
+    It uses skip-based reservoir sampling (Algorithm L), so it only draws
+    ``O(k log(n / k))`` random numbers for a corpus of size ``n``.
+
+    The documents are yielded in a random order, not the order of the
+    corpus.
+
+    """
+
+    def __init__(self, corpus, k, seed=None):
+        """Create a new object.
+
+        Parameters
+        -----------
+        corpus:
+            An iterable, usually of the type used as a corpus in :pkg:`gensim`.
+        k: int
+            The number of documents to sample.
+        seed:
+            Seed or NumPy random number generator. Each iteration draws a
+            different sample derived from it.
+
+        """
+        self.corpus = corpus
+        self.k = k
+        self.seed = seed
+
+    def _len(self):
+        return min(self.k, len(self.corpus))
+
+    def __iter__(self):
+        """Iterate over a random sample of elements from the corpus.
+
         Yields
         -------
         any
             An element from ``corpus``.
 
         """
-        for el in self.corpora:
-            if random.random() < self.p:
+        rng = _BufferedRandom(self._next_rng())
+        yield from self._count(_reservoir_sample(self.corpus, self.k, rng))
+
+
+class WeightedReservoirCorpus(_SizedCorpus, _RandomCorpus):
+    """Return a corpus that is a weighted random sample of a corpus.
+
+    This samples ``k`` documents without replacement, with probabilities
+    proportional to their weights, using reservoir sampling with
+    exponential jumps (A-ExpJ). It makes one pass over the corpus, keeps at
+    most ``k`` documents in memory, and only draws ``O(k log(n / k))``
+    random numbers for a corpus of size ``n``. Documents with a weight of
+    zero are never sampled.
+
+    The documents are yielded in a random order, not the order of the
+    corpus.
+
+    """
+
+    def __init__(self, corpus, k, weight, seed=None):
+        """Create a new object.
+
+        Parameters
+        -----------
+        corpus:
+            An iterable, usually of the type used as a corpus in :pkg:`gensim`.
+        k: int
+            The number of documents to sample.
+        weight: callable
+            A function that returns the non-negative weight of a document.
+        seed:
+            Seed or NumPy random number generator. Each iteration draws a
+            different sample derived from it.
+
+        """
+        self.corpus = corpus
+        self.k = k
+        self.weight = weight
+        self.seed = seed
+
+    def __iter__(self):
+        """Iterate over a weighted random sample of elements from the corpus.
+
+        Yields
+        -------
+        any
+            An element from ``corpus``.
+
+        """
+        rng = _BufferedRandom(self._next_rng())
+        yield from self._count(_weighted_reservoir_sample(
+            self.corpus, self.k, self.weight, rng))
+
+
+class MixedCorpus(_SizedCorpus, _RandomCorpus):
+    """Return a corpus that randomly mixes elements from multiple corpora.
+
+    Each element is drawn from corpus ``i`` with probability proportional
+    to ``weights[i]``. If ``temperature`` is given instead, the weight of
+    each corpus is its size raised to the power ``1 / temperature``, so
+    ``temperature=1`` samples in proportion to size and larger values move
+    towards sampling each corpus equally often. The corpora are not read
+    into memory; the choice of corpus is drawn in batches.
+
+    When a corpus is exhausted, ``stop`` decides what happens:
+
+    - ``"first"``: stop iterating.
+    - ``"all"``: continue with the remaining corpora, re-weighted, until
+      all corpora are exhausted.
+    - ``"cycle"``: restart the exhausted corpus, and stop once every
+      corpus with a positive weight has been exhausted at least once.
+      This repeats the smaller corpora to keep the target proportions.
+
+    """
+
+    def __init__(self, corpora, weights=None, temperature=None, stop="first",
+                 seed=None, sizes=None):
+        """Create a new object.
+
+        Parameters
+        -----------
+        corpora: sequence
+            Iterable corpora, usually of the type used as a corpus in
+            :pkg:`gensim`.
+        weights: sequence of float, optional
+            Non-negative weight of each corpus. If ``weights`` and
+            ``temperature`` are both ``None``, all corpora have equal weight.
+        temperature: float, optional
+            Weight corpora by their sizes raised to ``1 / temperature``.
+        stop: str
+            One of ``"first"``, ``"all"``, or ``"cycle"``.
+        seed:
+            Seed or NumPy random number generator. Each iteration uses
+            different random numbers derived from it.
+        sizes: sequence of int, optional
+            The sizes of the corpora, used with ``temperature``. If
+            ``None``, ``len()`` of each corpus is used.
+
+        """
+        if stop not in ("first", "all", "cycle"):
+            raise ValueError("stop must be one of 'first', 'all', or 'cycle'.")
+        if weights is not None and temperature is not None:
+            raise ValueError(
+                "Only one of weights or temperature can be given.")
+        self.corpora = list(corpora)
+        if temperature is not None:
+            if temperature <= 0:
+                raise ValueError("temperature must be positive.")
+            if sizes is None:
+                sizes = [len(c) for c in self.corpora]
+            weights = np.asarray(sizes, dtype=float) ** (1 / temperature)
+        elif weights is None:
+            weights = np.ones(len(self.corpora))
+        weights = np.asarray(weights, dtype=float)
+        if len(weights) != len(self.corpora):
+            raise ValueError("weights must have one element per corpus.")
+        if np.any(weights < 0) or not weights.sum() > 0:
+            raise ValueError(
+                "weights must be non-negative with a positive sum.")
+        self.probabilities = weights / weights.sum()
+        self.stop = stop
+        self.seed = seed
+
+    def _len(self):
+        # otherwise, the number of elements is random
+        if self.stop != "all":
+            raise TypeError
+        return sum(len(c) for c, p in zip(self.corpora, self.probabilities)
+                   if p > 0)
+
+    def __iter__(self):
+        """Iterate over randomly mixed elements from the corpora.
+
+        Yields
+        -------
+        any
+            An element from one of the corpora.
+
+        """
+        rng = self._next_rng()
+        probabilities = self.probabilities
+        nexts = [iter(c).__next__ for c in self.corpora]
+        # corpora with zero weight are never drawn
+        exhausted = probabilities == 0
+        while True:
+            for i in rng.choice(len(nexts), _BATCH_SIZE,
+                                p=probabilities).tolist():
+                try:
+                    el = nexts[i]()
+                except StopIteration:
+                    break
                 yield el
+            else:
+                continue
+            # corpus i is exhausted; the rest of the choices are discarded
+            if self.stop == "first":
+                return
+            exhausted[i] = True
+            if self.stop == "cycle" and not exhausted.all():
+                it = iter(self.corpora[i])
+                el = next(it, _SENTINEL)
+                if el is not _SENTINEL:
+                    nexts[i] = itertools.chain((el, ), it).__next__
+                    continue
+            elif self.stop == "cycle":
+                return
+            # drop the corpus
+            probabilities = probabilities.copy()
+            probabilities[i] = 0
+            if not probabilities.sum() > 0:
+                return
+            probabilities /= probabilities.sum()
+
+
+def _line_offsets(path, chunk_size=2 ** 24):
+    """Return the byte offsets of the starts of lines in a file.
+
+    The returned array has one more element than the number of lines;
+    the last element is the size of the file.
+
+    """
+    offsets = [np.zeros(1, dtype=np.uint64)]
+    pos = 0
+    last = b""
+    with open(path, "rb") as fs:
+        while True:
+            chunk = fs.read(chunk_size)
+            if not chunk:
+                break
+            newlines = np.flatnonzero(
+                np.frombuffer(chunk, dtype=np.uint8) == ord("\n"))
+            offsets.append((newlines + pos + 1).astype(np.uint64))
+            pos += len(chunk)
+            last = chunk[-1:]
+    offsets = np.concatenate(offsets)
+    # a final line without a new line
+    if pos and last != b"\n":
+        offsets = np.append(offsets, np.uint64(pos))
+    return offsets
+
+
+class LineCorpus:
+    """Return a corpus of the lines of a file, with random access.
+
+    An index of the byte offsets of the lines is built the first time it
+    is needed, by scanning the file once, and saved to a file next to it.
+    After that, the corpus has a length, and ``corpus[i]`` reads line ``i``
+    from a memory map of the file without reading the lines before it.
+    So it can be used with :class:`PermutedCorpus` or :class:`SampleCorpus`
+    to select lines from large files.
+
+    Iterating over the corpus reads the file sequentially and does not need
+    the index.
+
+    """
+
+    def __init__(self, path, loads=None, index_path=None, encoding="utf-8"):
+        """Create a new object.
+
+        Parameters
+        -----------
+        path: str
+            Path to a file with one document per line.
+        loads: callable, optional
+            A function to convert each line to a document, e.g.
+            :py:func:`json.loads`. Lines are decoded and the trailing new
+            line removed before being passed to it. If ``None``, the
+            decoded lines are the documents.
+        index_path: str, optional
+            Path of the cached line offset index. Defaults to ``path``
+            with ``.offsets.npy`` appended. The index is rebuilt if it is
+            older than the file or does not match its size.
+        encoding: str
+            Encoding of the file.
+
+        """
+        self.path = path
+        self.loads = loads
+        self.index_path = index_path or f"{path}.offsets.npy"
+        self.encoding = encoding
+        self._offsets = None
+        self._mmap = None
+
+    @property
+    def offsets(self):
+        """Array with the byte offsets of the lines and the file size."""
+        if self._offsets is None:
+            self._offsets = self._load_offsets()
+        return self._offsets
+
+    def _load_offsets(self):
+        stat = os.stat(self.path)
+        try:
+            if os.stat(self.index_path).st_mtime_ns >= stat.st_mtime_ns:
+                offsets = np.load(self.index_path)
+                if len(offsets) and offsets[-1] == stat.st_size:
+                    return offsets
+        except (OSError, ValueError):
+            pass
+        offsets = _line_offsets(self.path)
+        try:
+            with open(self.index_path, "wb") as fs:
+                np.save(fs, offsets)
+        except OSError:
+            pass
+        return offsets
+
+    def _decode(self, line):
+        line = line.decode(self.encoding).rstrip("\r\n")
+        return line if self.loads is None else self.loads(line)
+
+    def _read(self, start, end):
+        if start == end:
+            return b""
+        if self._mmap is None:
+            with open(self.path, "rb") as fs:
+                self._mmap = mmap.mmap(fs.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap[start:end]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        """Return line ``i``, or a list of lines if ``i`` is a slice."""
+        offsets = self.offsets
+        n = len(offsets) - 1
+        if isinstance(i, slice):
+            start, stop, step = i.indices(n)
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            if start >= stop:
+                return []
+            # read the lines with one read
+            data = self._read(int(offsets[start]), int(offsets[stop]))
+            lines = data.split(b"\n")
+            if data.endswith(b"\n"):
+                lines.pop()
+            return [self._decode(line) for line in lines]
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("line index out of range")
+        return self._decode(self._read(int(offsets[i]), int(offsets[i + 1])))
+
+    def __iter__(self):
+        """Iterate over the lines of the file.
+
+        Yields
+        -------
+        any
+            A document.
+
+        """
+        with open(self.path, "rb") as fs:
+            for line in fs:
+                yield self._decode(line)
+
+    def iter_range(self, start, end):
+        """Iterate over the lines starting in a range of bytes.
+
+        A line is included if its first byte is in ``[start, end)``. This
+        does not need the index, so the lines of a file can be split among
+        workers by byte ranges without reading the whole file.
+
+        Yields
+        -------
+        any
+            A document.
 
+        """
+        with open(self.path, "rb") as fs:
+            if start > 0:
+                # skip the rest of the line containing byte start - 1
+                fs.seek(start - 1)
+                fs.readline()
+            pos = fs.tell()
+            while pos < end:
+                line = fs.readline()
+                if not line:
+                    return
+                yield self._decode(line)
+                pos += len(line)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_mmap"] = None
+        return state
+
+
+def _slice(corpus, start, end, step=1):
+    """Return elements ``start`` to ``end`` of an indexable corpus."""
+    try:
+        return corpus[start:end:step]
+    except (TypeError, KeyError, ValueError):
+        return [corpus[i] for i in range(start, end, step)]
+
+
+class PermutedCorpus(_SizedCorpus, _RandomCorpus):
+    """Return a corpus in a different random order on each iteration.
+
+    For a corpus with a length and random access, such as a list or a
+    :class:`LineCorpus`, this yields the documents in a random permutation
+    without loading the corpus into memory. Only the permutation of the
+    document numbers is kept in memory. Each iteration (epoch) uses a
+    different permutation, which is reproducible if ``seed`` is given.
+
+    If ``block_size`` is given, the corpus is divided into blocks of
+    ``block_size`` consecutive documents. The order of the blocks is
+    shuffled, and then the order of the documents within each block. Each
+    block is read at once, which is much faster for files on disk, and
+    only the permutation of the blocks is kept in memory, but documents
+    close to each other in the corpus remain close in the output.
+
+    If ``batch_size`` is given, the corpus yields lists of ``batch_size``
+    elements instead of single elements.
+
+    """
+
+    def __init__(self, corpus, seed=None, block_size=None, batch_size=None):
+        """Create a new object.
+
+        Parameters
+        -----------
+        corpus:
+            A corpus with a length that supports indexing by integers.
+        seed: optional
+            Seed or NumPy random number generator.
+        block_size: int, optional
+            Number of consecutive documents to shuffle together.
+        batch_size: int, optional
+            If not ``None``, yield lists with this many elements.
+
+        """
+        if not _is_indexable(corpus):
+            raise ValueError("corpus must have a length and support indexing.")
+        self.corpus = corpus
+        self.seed = seed
+        self.block_size = block_size
+        self.batch_size = batch_size
+
+    def _len(self):
+        return _n_batches(len(self.corpus), self.batch_size)
+
+    def _permuted_chunks(self, rng):
+        """Yield lists of elements in a random order."""
+        n = len(self.corpus)
+        dtype = np.uint32 if n < 2 ** 32 else np.uint64
+        if self.block_size is None:
+            order = np.arange(n, dtype=dtype)
+            rng.shuffle(order)
+            for start in range(0, n, _BATCH_SIZE):
+                yield [self.corpus[i]
+                       for i in order[start:start + _BATCH_SIZE].tolist()]
+            return
+        n_blocks = -(-n // self.block_size)
+        blocks = np.arange(n_blocks, dtype=dtype)
+        rng.shuffle(blocks)
+        for b in blocks.tolist():
+            start = b * self.block_size
+            block = _slice(self.corpus, start, min(start + self.block_size, n))
+            yield [block[i] for i in rng.permutation(len(block)).tolist()]
+
+    def __iter__(self):
+        """Iterate over the corpus in a random order.
+
+        Yields
+        -------
+        any
+            An element from ``corpus``, or a list of them if ``batch_size``
+            is not ``None``.
+
+        """
+        yield from _flatten_or_rebatch(
+            self._permuted_chunks(self._next_rng()), self.batch_size)
+
+
+class ShardedCorpus(_SizedCorpus):
+    """Return the part of a corpus used by one of several workers.
+
+    This partitions a corpus among ``world_size`` workers, so that the
+    worker with number ``rank`` only yields, and as far as possible only
+    reads, its share of the documents. There are three ways to partition a
+    corpus:
+
+    - ``"stride"``: documents ``rank``, ``rank + world_size``, ... If the
+      corpus supports indexing, only these documents are read, and the
+      sharded corpus supports indexing too, so it can be wrapped with
+      :class:`PermutedCorpus` or :class:`SampleCorpus`. Otherwise, the
+      whole corpus is read and the other documents are skipped.
+    - ``"files"``: ``corpus`` is a sequence of corpora, e.g. one per file,
+      and the worker yields the documents of corpora ``rank``,
+      ``rank + world_size``, ...
+    - ``"bytes"``: ``corpus`` is a :class:`LineCorpus`, and the worker
+      yields the lines starting in its equal share of the bytes of the file.
+
+    Sharded corpora can be wrapped by the other corpora. When wrapping it in
+    corpora that use random numbers, set their ``worker`` attribute to
+    ``rank`` so that each worker uses different random numbers.
+
+    """
+
+    def __init__(self, corpus, rank, world_size, mode="stride"):
+        """Create a new object.
+
+        Parameters
+        -----------
+        corpus:
+            An iterable, usually of the type used as a corpus in :pkg:`gensim`,
+            a sequence of corpora if ``mode="files"``, or a
+            :class:`LineCorpus` if ``mode="bytes"``.
+        rank: int
+            Number of the worker, from 0 to ``world_size - 1``.
+        world_size: int
+            Number of workers.
+        mode: str
+            One of ``"stride"``, ``"files"``, or ``"bytes"``.
+
+        """
+        if not 0 <= rank < world_size:
+            raise ValueError("rank must be in 0, ..., world_size - 1.")
+        if mode not in ("stride", "files", "bytes"):
+            raise ValueError("mode must be one of 'stride', 'files', or "
+                             "'bytes'.")
+        if mode == "bytes" and not isinstance(corpus, LineCorpus):
+            raise ValueError("corpus must be a LineCorpus if mode='bytes'.")
+        self.corpus = corpus
+        self.rank = rank
+        self.world_size = world_size
+        self.mode = mode
+
+    @property
+    def indexable(self):
+        """Does the sharded corpus support indexing."""
+        return self.mode == "stride" and _is_indexable(self.corpus)
+
+    def _len(self):
+        if self.mode != "stride":
+            raise TypeError
+        return len(range(self.rank, len(self.corpus), self.world_size))
+
+    def __getitem__(self, i):
+        """Return document ``i`` of the shard."""
+        if not self.indexable:
+            raise TypeError("Sharded corpus does not support indexing.")
+        indices = range(self.rank, len(self.corpus), self.world_size)
+        if isinstance(i, slice):
+            return [self.corpus[j] for j in indices[i]]
+        return self.corpus[indices[i]]
+
+    def __iter__(self):
+        """Iterate over the documents of the shard.
+
+        Yields
+        -------
+        any
+            An element from ``corpus``.
+
+        """
+        yield from self._count(self._iter_shard())
+
+    def _iter_shard(self):
+        if self.mode == "files":
+            for corpus in itertools.islice(self.corpus, self.rank, None,
+                                           self.world_size):
+                yield from corpus
+        elif self.mode == "bytes":
+            size = os.path.getsize(self.corpus.path)
+            start = size * self.rank // self.world_size
+            end = size * (self.rank + 1) // self.world_size
+            yield from self.corpus.iter_range(start, end)
+        elif _is_indexable(self.corpus):
+            for i in range(self.rank, len(self.corpus), self.world_size):
+                yield self.corpus[i]
+        else:
+            yield from itertools.islice(self.corpus, self.rank, None,
+                                        self.world_size)
+
+
+def _put_unless_stopped(q, item, stop):
+    """Put an item in a queue, unless ``stop`` is set while waiting."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _get_from_worker(q, worker):
+    """Get an item from a queue, unless the worker putting items has died."""
+    while True:
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+        if not worker.is_alive():
+            # items put just before the worker exited may still arrive
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                exitcode = getattr(worker, "exitcode", None)
+                raise RuntimeError("Prefetch worker exited unexpectedly "
+                                   f"(exit code {exitcode}).") from None
+
+
+def _prefetch(corpus, q, batch_size, stop, pickle_errors=False):
+    """Read batches of documents from a corpus into a queue.
+
+    If ``pickle_errors`` is ``True``, exceptions that cannot be pickled are
+    replaced by a :py:class:`RuntimeError`, since a multiprocessing queue
+    would otherwise drop them.
+
+    """
+    try:
+        it = iter(corpus)
+        while not stop.is_set():
+            batch = list(itertools.islice(it, batch_size))
+            if not batch:
+                break
+            _put_unless_stopped(q, ("batch", batch), stop)
+    except Exception as e:
+        if pickle_errors:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError(repr(e))
+        _put_unless_stopped(q, ("error", e), stop)
+    else:
+        _put_unless_stopped(q, ("done", None), stop)
+
+
+class PrefetchCorpus(_SizedCorpus):
+    """Return a corpus that reads documents ahead in the background.
+
+    A background thread or process iterates over ``corpus`` and puts
+    batches of ``batch_size`` documents into a queue of at most ``depth``
+    batches, while the consumer takes documents from the queue. So reading
+    and decoding documents, e.g. decompressing and parsing JSON, overlaps
+    with using them. Exceptions raised while reading the corpus are raised
+    again in the consumer.
+
+    With ``backend="thread"``, reading overlaps with the consumer when it
+    waits on I/O or code that releases the GIL, such as decompression. With
+    ``backend="process"``, decoding runs in parallel, but the corpus and
+    documents must be picklable.
+
+    This can be wrapped by other corpora, e.g. ``ShuffledCorpus(
+    PrefetchCorpus(corpus), n=10000)``.
+
+    """
+
+    def __init__(self, corpus, depth=16, batch_size=64, backend="thread"):
+        """Create a new object.
+
+        Parameters
+        -----------
+        corpus:
+            An iterable, usually of the type used as a corpus in :pkg:`gensim`.
+        depth: int
+            The maximum number of batches in the queue.
+        batch_size: int
+            The number of documents in each batch put in the queue.
+        backend: str
+            Either ``"thread"`` or ``"process"``.
+
+        """
+        if backend not in ("thread", "process"):
+            raise ValueError("backend must be one of 'thread' or 'process'.")
+        self.corpus = corpus
+        self.depth = depth
+        self.batch_size = batch_size
+        self.backend = backend
+
+    def _len(self):
+        return len(self.corpus)
+
+    def __iter__(self):
+        """Iterate over the documents of the corpus.
+
+        Yields
+        -------
+        any
+            An element from ``corpus``.
+
+        """
+        yield from self._count(self._iter_queue())
+
+    def _iter_queue(self):
+        if self.backend == "thread":
+            q = queue.Queue(maxsize=self.depth)
+            stop = threading.Event()
+            worker = threading.Thread(
+                target=_prefetch, args=(self.corpus, q, self.batch_size, stop),
+                daemon=True)
+        else:
+            q = multiprocessing.Queue(maxsize=self.depth)
+            stop = multiprocessing.Event()
+            worker = multiprocessing.Process(
+                target=_prefetch,
+                args=(self.corpus, q, self.batch_size, stop, True),
+                daemon=True)
+        worker.start()
+        try:
+            while True:
+                kind, value = _get_from_worker(q, worker)
+                if kind == "batch":
+                    yield from value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            stop.set()
+            # empty the queue so the worker is not blocked putting items
+            while worker.is_alive():
+                try:
+                    q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            worker.join()
+
+
+class BatchedCorpus(_SizedCorpus):
+    """Return a corpus that yields batches of documents.
+
+    This yields lists of ``batch_size`` consecutive documents from
+    ``corpus``, or NumPy arrays if ``as_array`` is ``True``, so that code
+    using the corpus can process documents in batches. If the corpus
+    supports indexing and slicing, e.g. a list, array, or
+    :class:`LineCorpus`, each batch is read with one slice.
+
+    """
+
+    def __init__(self, corpus, batch_size, as_array=False, drop_last=False):
+        """Create a new object.
+
+        Parameters
+        -----------
+        corpus:
+            An iterable, usually of the type used as a corpus in :pkg:`gensim`.
+        batch_size: int
+            The number of documents in each batch.
+        as_array: bool
+            If ``True``, yield batches as :py:class:`numpy.ndarray`.
+        drop_last: bool
+            If ``True``, do not yield the last batch if it has fewer than
+            ``batch_size`` documents.
+
+        """
+        self.corpus = corpus
+        self.batch_size = batch_size
+        self.as_array = as_array
+        self.drop_last = drop_last
+
+    def _len(self):
+        return _n_batches(len(self.corpus), self.batch_size, self.drop_last)
+
+    def __iter__(self):
+        """Iterate over batches of documents.
+
+        Yields
+        -------
+        list or :py:class:`numpy.ndarray`
+            A batch of elements from ``corpus``.
+
+        """
+        if _is_indexable(self.corpus):
+            n = len(self.corpus)
+            batches = (_slice(self.corpus, start,
+                              min(start + self.batch_size, n))
+                       for start in range(0, n, self.batch_size))
+        else:
+            batches = _batches(self.corpus, self.batch_size)
+        yield from self._count(self._convert(batches))
+
+    def _convert(self, batches):
+        for batch in batches:
+            if self.drop_last and len(batch) < self.batch_size:
+                return
+            yield np.asarray(batch) if self.as_array else list(batch)
+
+
+class CountedCorpus(_SizedCorpus):
+    """Return a corpus with the length of a corpus, counted once.
+
+    If ``corpus`` does not have a length, ``len()`` of this corpus counts
+    its documents with one pass over it, or uses the count from a previous
+    complete iteration. If ``path`` is given, the count is saved to that
+    file and reused by later objects, until the file ``source`` changes.
+
+    """
+
+    def __init__(self, corpus, path=None, source=None):
+        """Create a new object.
+
+        Parameters
+        -----------
+        corpus:
+            An iterable, usually of the type used as a corpus in :pkg:`gensim`.
+        path: str, optional
+            Path of a JSON file to save the count in.
+        source: str, optional
+            Path of the file that ``corpus`` reads. The saved count is not
+            used if ``source`` has been modified since it was saved.
+
+        """
+        self.corpus = corpus
+        self.path = path
+        self.source = source
+
+    def _stat(self):
+        if self.source is None:
+            return None
+        stat = os.stat(self.source)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _load_count(self):
+        try:
+            with open(self.path, "r") as fs:
+                data = json.load(fs)
+            if data.get("source") == self._stat():
+                return int(data["count"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def _save_count(self):
+        try:
+            with open(self.path, "w") as fs:
+                json.dump({"count": self._length, "source": self._stat()}, fs)
+        except OSError:
+            pass
+
+    def __len__(self):
+        try:
+            return len(self.corpus)
+        except TypeError:
+            pass
+        if self._length is None and self.path is not None:
+            self._length = self._load_count()
+        if self._length is None:
+            for _ in self:
+                pass
+        return self._length
+
+    def __iter__(self):
+        """Iterate over the documents of the corpus.
+
+        Yields
+        -------
+        any
+            An element from ``corpus``.
+
+        """
+        counted = self._length is not None
+        yield from self._count(self.corpus)
+        if not counted and self.path is not None:
+            self._save_count()
+
+
+def _fingerprint(config):
+    """Return a hash of a JSON-serializable configuration."""
+    data = json.dumps(config, sort_keys=True, default=repr)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class CachedCorpus(_SizedCorpus):
+    """Return a corpus that caches the documents of a corpus on disk.
+
+    The first iteration over the corpus iterates over ``corpus`` and writes
+    the documents to shards of ``shard_size`` documents in the directory
+    ``path``. Later iterations, including by other objects with the same
+    ``path``, read the shards instead. So an expensive pipeline, e.g.
+    reading, parsing, and filtering documents, only runs once.
+
+    The cache is only used if it was completely written and its
+    ``fingerprint`` matches. The fingerprint should describe everything
+    that determines the documents, e.g. the input files and the
+    parameters of the pipeline. If it changes, the cache is rebuilt.
+
+    Once the cache is written, the corpus has a length and supports
+    indexing, and the ``cache_shards`` most recently used shards are kept
+    in memory. Reading a document loads its whole shard, so random access
+    is only fast if consecutive documents are read from the same shard.
+    To use it with :class:`PermutedCorpus`, set ``block_size`` to
+    ``shard_size``, so that each shard is loaded once per iteration,
+    unless ``cache_shards`` is large enough to keep all shards in memory.
+
+    The manifest is checked again before each iteration and document
+    lookup, so that a cache rewritten by another object with the same
+    ``path`` is not read with an outdated manifest.
+
+    """
+
+    def __init__(self, corpus, path, fingerprint=None, serializer=pickle,
+                 shard_size=10000, cache_shards=1):
+        """Create a new object.
+
+        Parameters
+        -----------
+        corpus:
+            An iterable, usually of the type used as a corpus in :pkg:`gensim`.
+        path: str
+            Directory of the cache. It is created if it does not exist.
+        fingerprint: optional
+            A JSON-serializable description of the corpus. Objects which
+            are not JSON-serializable are converted with :py:func:`repr`.
+        serializer:
+            An object with ``dump()`` and ``load()`` methods, like
+            :py:mod:`pickle`, used to write and read shards.
+        shard_size: int
+            The number of documents in each shard.
+        cache_shards: int
+            The number of shards to keep in memory. At least the most
+            recently used shard is kept.
+
+        """
+        self.corpus = corpus
+        self.path = path
+        self.fingerprint = _fingerprint(fingerprint)
+        self.serializer = serializer
+        self.shard_size = shard_size
+        self.cache_shards = cache_shards
+        self._manifest = None
+        self._manifest_mtime = None
+        self._shards = collections.OrderedDict()
+
+    @property
+    def manifest_path(self):
+        """Path of the manifest of the cache."""
+        return os.path.join(self.path, "manifest.json")
+
+    def _shard_path(self, i):
+        return os.path.join(self.path, f"shard-{i:06d}")
+
+    def _check_manifest(self):
+        """Forget the loaded manifest and shards if the manifest changed."""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._manifest_mtime:
+            self._manifest_mtime = mtime
+            self._manifest = None
+            self._shards.clear()
+
+    @property
+    def manifest(self):
+        """Description of the cache, or ``None`` if it is not valid."""
+        self._check_manifest()
+        if self._manifest is None and self._manifest_mtime is not None:
+            try:
+                with open(self.manifest_path, "r") as fs:
+                    manifest = json.load(fs)
+                if manifest.get("fingerprint") == self.fingerprint:
+                    self._manifest = manifest
+            except (OSError, ValueError):
+                pass
+        return self._manifest
+
+    @property
+    def indexable(self):
+        """Does the corpus support indexing."""
+        return self.manifest is not None
+
+    def invalidate(self):
+        """Delete the cache."""
+        self._manifest = None
+        self._manifest_mtime = None
+        self._shards.clear()
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name == "manifest.json" or name.startswith("shard-"):
+                os.remove(os.path.join(self.path, name))
+
+    def _len(self):
+        if self.manifest is None:
+            raise TypeError
+        return sum(self.manifest["shard_sizes"])
+
+    def _load_shard(self, i):
+        shard = self._shards.get(i)
+        if shard is not None:
+            self._shards.move_to_end(i)
+            return shard
+        with open(self._shard_path(i), "rb") as fs:
+            shard = self.serializer.load(fs)
+        self._shards[i] = shard
+        if len(self._shards) > max(self.cache_shards, 1):
+            self._shards.popitem(last=False)
+        return shard
+
+    def _get(self, i, n, shard_size):
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("corpus index out of range")
+        shard, j = divmod(i, shard_size)
+        return self._load_shard(shard)[j]
+
+    def __getitem__(self, i):
+        """Return document ``i``, or a list of documents for a slice."""
+        manifest = self.manifest
+        if manifest is None:
+            raise TypeError("CachedCorpus does not support indexing until "
+                            "the cache is written.")
+        n = sum(manifest["shard_sizes"])
+        shard_size = manifest["shard_size"]
+        if isinstance(i, slice):
+            return [self._get(j, n, shard_size)
+                    for j in range(*i.indices(n))]
+        return self._get(i, n, shard_size)
+
+    def _write(self):
+        os.makedirs(self.path, exist_ok=True)
+        # the old cache is not valid while it is overwritten
+        self.invalidate()
+        shard_sizes = []
+        for shard in _batches(self.corpus, self.shard_size):
+            with open(self._shard_path(len(shard_sizes)), "wb") as fs:
+                self.serializer.dump(shard, fs)
+            shard_sizes.append(len(shard))
+            yield from shard
+        manifest = {"fingerprint": self.fingerprint,
+                    "shard_size": self.shard_size,
+                    "shard_sizes": shard_sizes}
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as fs:
+            json.dump(manifest, fs)
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest = manifest
+        self._manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+
+    def _read(self, manifest):
+        for i in range(len(manifest["shard_sizes"])):
+            yield from self._load_shard(i)
+
+    def __iter__(self):
+        """Iterate over the documents of the corpus.
+
+        Yields
+        -------
+        any
+            An element from ``corpus``.
+
+        """
+        manifest = self.manifest
+        if manifest is None:
+            yield from self._write()
+        else:
+            yield from self._read(manifest)
@@ -1,10 +1,21 @@
 """Convert SpaCy documents to formats."""
-import re
+import collections
+import itertools
+import mmap
+import multiprocessing
+import os
 import pickle
+import re
+import struct
 
+import numpy as np
 import spacy.attrs
+import spacy.parts_of_speech
+import spacy.symbols
 from spacy.tokens import Doc
 
+from .utils import SpanIndex
+
 
 _DEFAULT_ATTRS = [
     # spacy.attrs.ORTH,
@@ -71,12 +82,564 @@ def load_doc(vocab, file):
         A SpaCy document
 
     """  # noqa
-    return doc_from_tuple(vocab, *pickle.load(file))
+    return doc_from_tuple(vocab, pickle.load(file))
 
 
 def loads_doc(vocab, bytes_object):
     """Load a document from vocab and a pickled string."""
-    return doc_from_tuple(vocab, *pickle.loads(bytes_object))
+    return doc_from_tuple(vocab, pickle.loads(bytes_object))
+
+
+def dump_docs(docs, file, attrs=None):
+    """Pickle and dump multiple documents to ``file``.
+
+    Each document is pickled separately, as in :func:`dump_doc`, so the
+    file can be read with :func:`load_docs` or repeated calls to
+    :func:`load_doc`.
+
+    Parameters
+    -----------
+    docs: iterable of :py:class:`spacy.tokens.Doc`
+        SpaCy documents
+    file: file
+        An open file object
+    attrs: list, optional
+        Attributes to store. See :func:`doc_to_tuple`.
+
+    Returns
+    --------
+    int
+        The number of documents written.
+
+    """
+    n = 0
+    for doc in docs:
+        pickle.dump(doc_to_tuple(doc, attrs), file)
+        n += 1
+    return n
+
+
+def _iter_pickled(file):
+    """Yield objects from a file of pickled objects until the end."""
+    while True:
+        try:
+            yield pickle.load(file)
+        except EOFError:
+            return
+
+
+def _chunks(iterable, n):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+_WORKER_VOCAB = None
+_WORKER_FUNC = None
+
+
+def _init_load_worker(vocab, func):
+    """Set the vocab and function used by a worker process."""
+    global _WORKER_VOCAB, _WORKER_FUNC
+    _WORKER_VOCAB = vocab
+    _WORKER_FUNC = func
+
+
+def _load_chunk(chunk):
+    return [_WORKER_FUNC(doc_from_tuple(_WORKER_VOCAB, x)) for x in chunk]
+
+
+def load_docs(vocab, file, func=None, processes=None, chunksize=64,
+              max_pending=None):
+    """Load pickled documents from a file, optionally in parallel.
+
+    Documents are read from a file of pickled tuples, as written by
+    :func:`dump_docs` or :func:`dump_doc`. If ``processes`` is given, the
+    documents are rebuilt and passed to ``func`` in a pool of worker
+    processes. The vocab is sent to each worker once when it starts,
+    rather than with each task. Results are yielded in the order of the
+    documents in the file, and at most ``max_pending`` chunks of
+    documents are read ahead of the results, so memory use is bounded.
+
+    Since a SpaCy document cannot be sent between processes without
+    also pickling its vocab, parallel loading requires a ``func`` that
+    returns something cheaper to send back, e.g. the features or tokens
+    needed from the document.
+
+    Parameters
+    -----------
+    vocab: :py:class:`spacy.vocab.Vocab`
+        The vocab used to create the pickled documents
+    file: file
+        An open file object
+    func: callable, optional
+        A function applied to each document. If ``processes`` is not
+        ``None``, it must be picklable, e.g. a module-level function.
+    processes: int, optional
+        The number of worker processes. If ``None``, documents are loaded
+        in this process.
+    chunksize: int
+        The number of documents sent to a worker in each task.
+    max_pending: int, optional
+        The maximum number of chunks being processed at once. Defaults to
+        twice the number of processes.
+
+    Yields
+    -------
+    :py:class:`spacy.tokens.Doc` or any
+        A SpaCy document, or the result of ``func`` applied to it.
+
+    """
+    tuples = _iter_pickled(file)
+    if processes is None:
+        for x in tuples:
+            doc = doc_from_tuple(vocab, x)
+            yield doc if func is None else func(doc)
+        return
+    if func is None:
+        raise ValueError("func is required if processes is not None.")
+    max_pending = max_pending or 2 * processes
+    pending = collections.deque()
+    with multiprocessing.Pool(processes, initializer=_init_load_worker,
+                              initargs=(vocab, func)) as pool:
+        for chunk in _chunks(tuples, chunksize):
+            pending.append(pool.apply_async(_load_chunk, (chunk, )))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+# Document streams
+#
+# A document stream is a binary file with multiple documents in the
+# ``doc_to_tuple`` representation. All integers are little-endian.
+#
+# - header: magic bytes, the number of attributes (uint32), and the
+#   attribute ids (uint64)
+# - blocks of documents, each with
+#   - block header: attribute array dtype, number of docs, number of new
+#     strings, number of tokens, and size of the string data
+#   - lengths in characters of the new strings (uint32) and their UTF-8
+#     data. Token strings are stored once per file, in a string table
+#     which is the concatenation of the new strings of all blocks.
+#   - number of tokens in each document (uint32)
+#   - string table ids of the tokens (uint32)
+#   - whether each token is followed by whitespace (uint8)
+#   - the concatenated attribute arrays of the documents
+#
+# Each section is padded to a multiple of 8 bytes, so that the arrays
+# can be used directly from a memory map.
+
+_DOC_STREAM_MAGIC = b"TSDOCS01"
+_DOC_STREAM_COUNT = struct.Struct("<I")
+_DOC_STREAM_BLOCK = struct.Struct("<8sIIQQ")
+
+_DocStreamBlock = collections.namedtuple(
+    "_DocStreamBlock",
+    ["dtype", "strings", "doc_lengths", "offset", "token_ids", "spaces",
+     "array"])
+
+
+def _padding(n):
+    return -n % 8
+
+
+def _attr_ids(attrs):
+    """Convert attribute names to attribute ids."""
+    return [spacy.attrs.IDS[x.upper()] if isinstance(x, str) else int(x)
+            for x in attrs]
+
+
+def _read_exactly(fs, n):
+    data = fs.read(n)
+    if len(data) < n:
+        raise ValueError("Truncated document stream.")
+    return data
+
+
+def _write_doc_stream_header(fs, attrs):
+    fs.write(_DOC_STREAM_MAGIC)
+    fs.write(_DOC_STREAM_COUNT.pack(len(attrs)))
+    fs.write(np.asarray(attrs, dtype="<u8").tobytes())
+
+
+def _read_doc_stream_header(fs):
+    """Read the header of a document stream and return its attributes."""
+    if fs.read(len(_DOC_STREAM_MAGIC)) != _DOC_STREAM_MAGIC:
+        raise ValueError("Not a document stream.")
+    n_attrs, = _DOC_STREAM_COUNT.unpack(_read_exactly(fs, 4))
+    attrs = np.frombuffer(_read_exactly(fs, 8 * n_attrs), dtype="<u8")
+    return [int(x) for x in attrs]
+
+
+def _read_doc_stream_block(fs, n_attrs, read_arrays=True):
+    """Read a block from a document stream.
+
+    Returns ``None`` at the end of the file. If ``read_arrays`` is
+    ``False``, the token ids, spaces, and attribute arrays are skipped and
+    only their file offset is returned.
+
+    """
+    data = fs.read(_DOC_STREAM_BLOCK.size)
+    if not data:
+        return None
+    if len(data) < _DOC_STREAM_BLOCK.size:
+        raise ValueError("Truncated document stream.")
+    dtype, n_docs, n_strings, n_tokens, strings_nbytes = \
+        _DOC_STREAM_BLOCK.unpack(data)
+    dtype = np.dtype(dtype.rstrip(b"\0").decode("ascii"))
+    lengths = np.frombuffer(_read_exactly(fs, 4 * n_strings), dtype="<u4")
+    fs.read(_padding(4 * n_strings))
+    text = _read_exactly(fs, strings_nbytes).decode("utf-8")
+    fs.read(_padding(strings_nbytes))
+    # lengths are numbers of characters, so split the decoded text
+    strings = []
+    pos = 0
+    for length in lengths.tolist():
+        strings.append(text[pos:pos + length])
+        pos += length
+    doc_lengths = np.frombuffer(_read_exactly(fs, 4 * n_docs), dtype="<u4")
+    fs.read(_padding(4 * n_docs))
+    offset = fs.tell()
+    sizes = [4 * n_tokens, n_tokens, n_tokens * n_attrs * dtype.itemsize]
+    if not read_arrays:
+        fs.seek(sum(x + _padding(x) for x in sizes), os.SEEK_CUR)
+        return _DocStreamBlock(dtype, strings, doc_lengths, offset,
+                               None, None, None)
+    arrays = []
+    for size, dt in zip(sizes, ["<u4", "u1", dtype]):
+        arrays.append(np.frombuffer(_read_exactly(fs, size), dtype=dt))
+        fs.read(_padding(size))
+    token_ids, spaces, array = arrays
+    return _DocStreamBlock(dtype, strings, doc_lengths, offset,
+                           token_ids, spaces.astype(bool),
+                           array.reshape(n_tokens, n_attrs))
+
+
+class DocStreamWriter:
+    """Write SpaCy documents to a binary document stream.
+
+    A document stream stores many documents in the :func:`doc_to_tuple`
+    representation, but more compactly than pickling a tuple per document
+    (see :func:`dump_doc`). The attribute list is stored once per file,
+    the token strings are stored once per file in a shared string table,
+    and documents are written in blocks of concatenated arrays with a table
+    of document lengths.
+
+    Documents are buffered and written a block at a time. Use
+    :func:`iter_doc_stream` to read the documents back one at a time.
+
+    Parameters
+    -----------
+    file: str or file
+        A path or a file object opened in binary mode. If ``file`` is a
+        path to an existing document stream, new documents are appended to
+        it.
+    attrs: list, optional
+        The attributes to store. Defaults to the attributes needed to
+        reconstruct a parse. When appending, this must be ``None`` or the
+        same as the attributes of the existing file.
+    block_size: int
+        Number of documents in each block.
+
+    """
+
+    def __init__(self, file, attrs=None, block_size=1000):
+        attrs = _attr_ids(attrs) if attrs is not None else None
+        self.block_size = block_size
+        self._strings = {}
+        self._new_strings = []
+        self._docs = []
+        if isinstance(file, (str, os.PathLike)):
+            if os.path.exists(file) and os.path.getsize(file) > 0:
+                attrs = self._scan(file, attrs)
+                self._fs = open(file, "ab")
+            else:
+                self._fs = open(file, "wb")
+                self.attrs = attrs or _attr_ids(_DEFAULT_ATTRS)
+                _write_doc_stream_header(self._fs, self.attrs)
+            self._close = True
+        else:
+            self._fs = file
+            self.attrs = attrs or _attr_ids(_DEFAULT_ATTRS)
+            _write_doc_stream_header(self._fs, self.attrs)
+            self._close = False
+
+    def _scan(self, path, attrs):
+        """Read the attributes and string table of an existing file."""
+        with open(path, "rb") as fs:
+            self.attrs = _read_doc_stream_header(fs)
+            if attrs is not None and attrs != self.attrs:
+                msg = "attrs do not match the attributes of the file."
+                raise ValueError(msg)
+            while True:
+                block = _read_doc_stream_block(fs, len(self.attrs),
+                                               read_arrays=False)
+                if block is None:
+                    break
+                for string in block.strings:
+                    self._strings[string] = len(self._strings)
+
+    def _string_id(self, string):
+        try:
+            return self._strings[string]
+        except KeyError:
+            i = self._strings[string] = len(self._strings)
+            self._new_strings.append(string)
+            return i
+
+    def write(self, doc):
+        """Add a document to the stream."""
+        tokens, whitespace, _, array = doc_to_tuple(doc, self.attrs)
+        token_ids = [self._string_id(tok) for tok in tokens]
+        self._docs.append((token_ids, whitespace, array))
+        if len(self._docs) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        """Write any buffered documents to the file."""
+        if not self._docs:
+            return
+        docs = self._docs
+        n_tokens = sum(len(token_ids) for token_ids, _, _ in docs)
+        encoded = [x.encode("utf-8") for x in self._new_strings]
+        strings_data = b"".join(encoded)
+        arrays = [array.reshape(len(token_ids), len(self.attrs))
+                  for token_ids, _, array in docs]
+        array = np.concatenate(arrays)
+        array = array.astype(array.dtype.newbyteorder("<"), copy=False)
+        header = _DOC_STREAM_BLOCK.pack(
+            array.dtype.str.encode("ascii"), len(docs), len(encoded),
+            n_tokens, len(strings_data))
+        sections = [
+            header,
+            np.fromiter((len(x) for x in self._new_strings), dtype="<u4",
+                        count=len(encoded)).tobytes(),
+            strings_data,
+            np.fromiter((len(token_ids) for token_ids, _, _ in docs),
+                        dtype="<u4", count=len(docs)).tobytes(),
+            np.fromiter((i for token_ids, _, _ in docs for i in token_ids),
+                        dtype="<u4", count=n_tokens).tobytes(),
+            np.fromiter((ws for _, whitespace, _ in docs
+                         for ws in whitespace),
+                        dtype="u1", count=n_tokens).tobytes(),
+            array.tobytes()
+        ]
+        for section in sections:
+            self._fs.write(section)
+            self._fs.write(b"\0" * _padding(len(section)))
+        self._fs.flush()
+        self._docs = []
+        self._new_strings = []
+
+    def close(self):
+        """Write any buffered documents and close the file."""
+        self.flush()
+        if self._close:
+            self._fs.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def iter_doc_stream_tuples(file):
+    """Yield documents from a document stream as tuples.
+
+    Parameters
+    -----------
+    file: str or file
+        A path or a file object opened in binary mode.
+
+    Yields
+    -------
+    tuple
+        A tuple ``(tokens, whitespace, attrs, array)`` as returned by
+        :func:`doc_to_tuple`.
+
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as fs:
+            yield from iter_doc_stream_tuples(fs)
+        return
+    attrs = _read_doc_stream_header(file)
+    strings = []
+    while True:
+        block = _read_doc_stream_block(file, len(attrs))
+        if block is None:
+            break
+        strings.extend(block.strings)
+        tokens = [strings[i] for i in block.token_ids.tolist()]
+        whitespace = block.spaces.tolist()
+        start = 0
+        for length in block.doc_lengths.tolist():
+            end = start + length
+            yield (tokens[start:end], whitespace[start:end], attrs,
+                   block.array[start:end])
+            start = end
+
+
+def iter_doc_stream(vocab, file):
+    """Yield SpaCy documents from a document stream.
+
+    The documents are read one block at a time, so only a block of
+    documents is in memory at once.
+
+    Parameters
+    -----------
+    vocab: :py:class:`spacy.vocab.Vocab`
+        The vocab used to create the documents
+    file: str or file
+        A path or a file object opened in binary mode.
+
+    Yields
+    -------
+    :py:class:`spacy.tokens.Doc`
+        A SpaCy document
+
+    """
+    for x in iter_doc_stream_tuples(file):
+        yield doc_from_tuple(vocab, x)
+
+
+class DocStreamReader:
+    """Random access to documents in a document stream.
+
+    The file is memory mapped, and an index of the documents is built
+    when it is opened. This only reads the block headers, string tables,
+    and document lengths; the token and attribute arrays are only read
+    when a document is accessed. So ``reader[i]`` takes constant time
+    regardless of the position of the document in the file, and
+    :meth:`get_array` returns the attribute array of a document without
+    copying it.
+
+    See :class:`DocStreamWriter` for writing document streams.
+
+    Parameters
+    -----------
+    file: str
+        Path to a document stream.
+    vocab: :py:class:`spacy.vocab.Vocab`, optional
+        The vocab used to create the documents. It is only needed to
+        rebuild documents with ``reader[i]`` or by iterating.
+
+    Attributes
+    -----------
+    attrs: list of int
+        The attributes stored in the file.
+
+    """
+
+    def __init__(self, file, vocab=None):
+        self.vocab = vocab
+        self._fs = open(file, "rb")
+        try:
+            self.attrs = _read_doc_stream_header(self._fs)
+            self._strings = []
+            self._blocks = []
+            doc_block = []
+            doc_lengths = []
+            while True:
+                block = _read_doc_stream_block(self._fs, len(self.attrs),
+                                               read_arrays=False)
+                if block is None:
+                    break
+                self._strings.extend(block.strings)
+                doc_block.append(np.full(len(block.doc_lengths),
+                                         len(self._blocks), dtype=np.int64))
+                doc_lengths.append(block.doc_lengths.astype(np.int64))
+                self._blocks.append((block.offset,
+                                     int(block.doc_lengths.sum()),
+                                     block.dtype))
+            self._mmap = mmap.mmap(self._fs.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except Exception:
+            self._fs.close()
+            raise
+        self._doc_block = (np.concatenate(doc_block) if doc_block else
+                           np.zeros(0, dtype=np.int64))
+        self._doc_length = (np.concatenate(doc_lengths) if doc_lengths else
+                            np.zeros(0, dtype=np.int64))
+        # token offset of each document within its block
+        ends = np.cumsum(self._doc_length)
+        self._doc_start = ends - self._doc_length
+        if len(ends):
+            block_starts = np.zeros(len(self._blocks), dtype=np.int64)
+            block_starts[1:] = np.cumsum(
+                [n_tokens for _, n_tokens, _ in self._blocks])[:-1]
+            self._doc_start -= block_starts[self._doc_block]
+
+    def __len__(self):
+        return len(self._doc_length)
+
+    def _locate(self, i):
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("document index out of range")
+        offset, n_tokens, dtype = self._blocks[self._doc_block[i]]
+        return (offset, n_tokens, dtype, int(self._doc_start[i]),
+                int(self._doc_length[i]))
+
+    def get_array(self, i):
+        """Return the attribute array of document ``i``.
+
+        The array is a read-only view of the memory mapped file, with one
+        row per token and one column per attribute in :attr:`attrs`.
+
+        """
+        offset, n_tokens, dtype, start, length = self._locate(i)
+        n_attrs = len(self.attrs)
+        # skip the token ids and spaces sections of the block
+        offset += sum(x + _padding(x) for x in [4 * n_tokens, n_tokens])
+        offset += start * n_attrs * dtype.itemsize
+        return np.frombuffer(self._mmap, dtype=dtype, count=length * n_attrs,
+                             offset=offset).reshape(length, n_attrs)
+
+    def get_tuple(self, i):
+        """Return document ``i`` in the :func:`doc_to_tuple` representation."""
+        offset, n_tokens, _, start, length = self._locate(i)
+        token_ids = np.frombuffer(self._mmap, dtype="<u4", count=length,
+                                  offset=offset + 4 * start)
+        offset += 4 * n_tokens + _padding(4 * n_tokens)
+        spaces = np.frombuffer(self._mmap, dtype="u1", count=length,
+                               offset=offset + start)
+        tokens = [self._strings[j] for j in token_ids.tolist()]
+        return (tokens, spaces.astype(bool).tolist(), self.attrs,
+                self.get_array(i))
+
+    def __getitem__(self, i):
+        """Return document ``i`` as a :py:class:`spacy.tokens.Doc`."""
+        if self.vocab is None:
+            raise ValueError("A vocab is needed to create documents.")
+        return doc_from_tuple(self.vocab, self.get_tuple(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        """Close the file.
+
+        Arrays returned by :meth:`get_array` must be deleted first, since
+        they are views of the memory map.
+
+        """
+        self._mmap.close()
+        self._fs.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
 
 def _rep_val(x):
@@ -108,66 +671,424 @@ def token_whitespace(doc):
             yield (tok, ws)
 
 
+_CONLL_ATTRS = [
+    spacy.attrs.ORTH,
+    spacy.attrs.LEMMA,
+    spacy.attrs.POS,
+    spacy.attrs.TAG,
+    spacy.attrs.HEAD,
+    spacy.attrs.DEP,
+    spacy.attrs.SPACY
+]
+"""Attributes used to write CONLL formats."""
+
+
+class _StringLookup(dict):
+    """Cache of CONLL field values of strings in a string store."""
+
+    def __init__(self, strings):
+        super().__init__()
+        self.strings = strings
+
+    def __missing__(self, key):
+        value = self[key] = _rep_val(self.strings[key] or None)
+        return value
+
+
+def _conll_columns(doc, lookup):
+    """Return the columns of a document needed for CONLL formats.
+
+    Returns a tuple with lists of the form, lemma, POS, tag, and
+    dependency strings, and arrays with the absolute head index and
+    trailing whitespace of each token, and whether it is a whitespace
+    token.
+
+    """
+    n = len(doc)
+    arr = doc.to_array(_CONLL_ATTRS).reshape(n, len(_CONLL_ATTRS))
+    strings = tuple([lookup[x] for x in arr[:, j].tolist()]
+                    for j in (0, 1, 2, 3, 5))
+    # HEAD is the offset of the head, stored as an unsigned int
+    heads = np.arange(n) + arr[:, 4].astype(np.int64)
+    spaces = arr[:, 6].astype(bool)
+    is_space = arr[:, 2] == spacy.symbols.SPACE
+    return strings + (heads, spaces, is_space)
+
+
+def _sent_heads(heads, start, end, ids=None):
+    """Return CONLL head ids for the tokens of a sentence.
+
+    Roots and tokens with heads outside the sentence have a head of 0.
+    ``ids`` are the 1-indexed ids of the tokens in the sentence. If
+    ``None``, tokens are numbered consecutively.
+
+    """
+    rel = heads[start:end] - start
+    n = end - start
+    if ids is None:
+        ids = np.arange(1, n + 1)
+    inside = (rel >= 0) & (rel < n)
+    out = np.zeros(n, dtype=np.int64)
+    out[inside] = ids[rel[inside]]
+    out[rel == np.arange(n)] = 0
+    return out
+
+
+def _collapse_ws(text):
+    return " ".join(text.split())
+
+
+def _write_conllu(doc, fs, lookup, sent_headers=True, doc_text=True,
+                  sent_ids=None, doc_id=None):
+    forms, lemmas, pos, tags, deps, heads, spaces, is_space = \
+        _conll_columns(doc, lookup)
+    # whitespace tokens are dropped, so a token is followed by a space if
+    # it has trailing whitespace or the next token is whitespace.
+    space_after = spaces.copy()
+    space_after[:-1] |= is_space[1:]
+    if len(space_after):
+        space_after[-1] = True
+    misc = ["_" if x else "SpaceAfter=No" for x in space_after.tolist()]
+    keep = ~is_space
+    index = SpanIndex(doc)
+    sents = index.spans("sents")
+    sent_ids = iter(sent_ids) if sent_ids is not None else None
+    # the document comments are part of the first sentence, since a
+    # block of comments without tokens is not valid CONLL-U
+    header = ["# newdoc\n" if doc_id is None else f"# newdoc id = {doc_id}\n"]
+    if doc_text and not sent_headers:
+        header.append(f"# text = {_collapse_ws(doc.text)}\n")
+    for i, sent in enumerate(sents):
+        start, end = sent.start, sent.end
+        sent_keep = keep[start:end]
+        if not sent_keep.any():
+            continue
+        # ids of the tokens in the sentence after dropping whitespace
+        # tokens; whitespace tokens share the id of the previous token
+        ids = np.cumsum(sent_keep)
+        sent_heads = _sent_heads(heads, start, end, ids).tolist()
+        lines = header
+        header = []
+        if sent_headers:
+            sent_id = next(sent_ids) if sent_ids is not None else i + 1
+            lines.append(f"# sent_id = {sent_id}\n"
+                         f"# text = {_collapse_ws(sent.text)}\n")
+        for j, k in enumerate(range(start, end)):
+            if sent_keep[j]:
+                lines.append(f"{ids[j]}\t{forms[k]}\t{lemmas[k]}\t{pos[k]}\t"
+                             f"{tags[k]}\t_\t{sent_heads[j]}\t{deps[k]}\t_\t"
+                             f"{misc[k]}\n")
+        lines.append("\n")
+        fs.write("".join(lines))
+
+
 def to_conllu(doc,
               fs,
               sent_headers=True,
               doc_text=True,
               sent_ids=None,
               doc_id=None):
-    """Dump Document to CONLL-U format."""
+    """Dump Document to CONLL-U format.
+
+    Whitespace tokens are dropped, and recorded with ``SpaceAfter=No`` in
+    the MISC column of the preceding token. Each sentence is written with a
+    single write to ``fs``.
+
+    Parameters
+    -----------
+    doc: :py:class:`spacy.tokens.Doc`
+        A parsed SpaCy document
+    fs: file
+        A file object opened in text mode
+    sent_headers: bool
+        Write ``sent_id`` and ``text`` comments before each sentence.
+    doc_text: bool
+        Write a comment with the text of the document before the first
+        sentence. It is only written if ``sent_headers`` is false, since
+        otherwise each sentence has a ``text`` comment.
+    sent_ids: iterable, optional
+        Ids of the sentences. Defaults to the sentence numbers starting at 1.
+    doc_id: str, optional
+        Id of the document, written in the ``newdoc`` comment.
+
+    """
     # fields = ("ID", "FORM", "LEMMA", "UPOSTAG", "XPOSTAG", "FEATS", "HEAD",
     #           "DEPREL", "DEPS", "MISC")
-    if doc_text:
-        text = re.sub(r"\s+", " ", doc.text)
-        fs.write(f"# text = {text}\n\n")
-    for i, sent in enumerate(doc.sents):
-        if i > 0:
-            fs.write("\n")
-        if sent_headers:
-            fs.write(f"# sent_id = {i + 1}\n")
-            fs.write(f"# text = {sent.text}\n")
-        tokens = token_whitespace(sent)
-        for j, (tok, ws) in enumerate(tokens):
-            head = str(tok.head.i + 1)
-            feats = None
-            if ws:
-                misc = None
-            else:
-                misc = "SpacesAfter=No"
-            row = (j + 1, tok.orth_, tok.lemma_, tok.pos_, tok.tag_, feats,
-                   head, tok.dep_, misc)
-            fs.write('\t'.join(_rep_val(c) for c in row) + "\n")
+    _write_conllu(doc, fs, _StringLookup(doc.vocab.strings),
+                  sent_headers=sent_headers, doc_text=doc_text,
+                  sent_ids=sent_ids, doc_id=doc_id)
+
+
+def write_conllu(docs, file, doc_ids=None, **kwargs):
+    """Write multiple documents to a CONLL-U file.
+
+    Parameters
+    -----------
+    docs: iterable of :py:class:`spacy.tokens.Doc`
+        Parsed SpaCy documents. They are assumed to share a vocab.
+    file: str or file
+        A path or a file object opened in text mode.
+    doc_ids: iterable, optional
+        Ids of the documents. Defaults to the document numbers starting
+        at 1.
+    **kwargs:
+        Passed to :func:`to_conllu`.
+
+    Returns
+    --------
+    int
+        The number of documents written.
+
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "w", encoding="utf-8") as fs:
+            return write_conllu(docs, fs, doc_ids=doc_ids, **kwargs)
+    doc_ids = iter(doc_ids) if doc_ids is not None else itertools.count(1)
+    lookup = None
+    n = 0
+    for doc, doc_id in zip(docs, doc_ids):
+        # strings are shared by documents with the same vocab
+        if lookup is None or lookup.strings is not doc.vocab.strings:
+            lookup = _StringLookup(doc.vocab.strings)
+        _write_conllu(doc, file, lookup, doc_id=doc_id, **kwargs)
+        n += 1
+    return n
 
 
 def to_conllx(doc, fs, sent_headers=True, doc_text=True, projective=True):
-    """Dump Document to CONLL-X 2006 format."""
-    for i, sent in enumerate(doc.sents):
-        if i > 0:
-            fs.write("\n")
-        for j, tok in enumerate(sent):
-            if tok.dep_ == "ROOT":
-                head = "0"
-            else:
-                head = str(tok.head.i + 1)
-            deprel = tok.dep_
-            #  is
+    """Dump Document to CONLL-X 2006 format.
+
+    Whitespace tokens are dropped. Each sentence is written with a single
+    write to ``fs``.
+
+    """
+    forms, lemmas, pos, tags, deps, heads, _, is_space = \
+        _conll_columns(doc, _StringLookup(doc.vocab.strings))
+    keep = ~is_space
+    index = SpanIndex(doc)
+    for start, end in zip(index.starts("sents").tolist(),
+                          index.ends("sents").tolist()):
+        sent_keep = keep[start:end]
+        if not sent_keep.any():
+            continue
+        # tokens are 1-indexed
+        ids = np.cumsum(sent_keep)
+        sent_heads = _sent_heads(heads, start, end, ids).tolist()
+        lines = []
+        for j, k in enumerate(range(start, end)):
+            if not sent_keep[j]:
+                continue
+            head = sent_heads[j]
+            deprel = deps[k]
             if projective:
                 phead = head
                 pdeprel = deprel
             else:
-                phead = None
-                pdeprel = None
-            # tokens are 1-indexed
-            row = (j + 1, tok.orth_, tok.lemma_, tok.pos_, tok.tag_, None,
-                   head, deprel, phead, pdeprel)
-            fs.write('\t'.join(_rep_val(x) for x in row) + "\n")
-
-
-def _prev_tok(tok, k=1):
-    try:
-        return tok.doc[tok.i - k]
-    except IndexError:
-        return None
+                phead = "_"
+                pdeprel = "_"
+            lines.append(f"{ids[j]}\t{forms[k]}\t{lemmas[k]}\t{pos[k]}\t"
+                         f"{tags[k]}\t_\t{head}\t{deprel}\t{phead}\t"
+                         f"{pdeprel}\n")
+        lines.append("\n")
+        fs.write("".join(lines))
+
+
+# Reading CONLL formats
+
+_CONLL_READ_ATTRS = [
+    spacy.attrs.LEMMA,
+    spacy.attrs.POS,
+    spacy.attrs.TAG,
+    spacy.attrs.HEAD,
+    spacy.attrs.DEP
+]
+"""Attributes set from CONLL formats."""
+
+# columns of FORM, LEMMA, coarse POS, fine-grained tag, HEAD, and DEPREL
+_CONLL_COLUMNS = (1, 2, 3, 4, 6, 7)
+
+
+class _StringIds(dict):
+    """Cache of the ids of strings added to a string store."""
+
+    def __init__(self, strings):
+        super().__init__()
+        self.strings = strings
+
+    def __missing__(self, key):
+        if key == "_":
+            value = 0
+        elif hasattr(self.strings, "add"):
+            value = self.strings.add(key)
+        else:
+            # SpaCy < 2 adds strings on lookup
+            value = self.strings[key]
+        self[key] = value
+        return value
+
+
+def _iter_conll_blocks(fs):
+    """Yield ``(comments, rows)`` for each blank line delimited block."""
+    comments = []
+    rows = []
+    for line in fs:
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            if comments or rows:
+                yield comments, rows
+            comments = []
+            rows = []
+        elif line.startswith("#"):
+            comments.append(line)
+        else:
+            rows.append(line.split("\t"))
+    if comments or rows:
+        yield comments, rows
+
+
+def _conll_doc(vocab, sents, string_ids, conllu=True):
+    """Create a document from the rows of CONLL sentences."""
+    words = []
+    spaces = []
+    values = []
+    heads = []
+    for rows in sents:
+        if conllu:
+            # skip multiword tokens and empty nodes
+            rows = [row for row in rows
+                    if "-" not in row[0] and "." not in row[0]]
+        for j, row in enumerate(rows):
+            form, lemma, pos, tag, head, dep = (row[k]
+                                                for k in _CONLL_COLUMNS)
+            words.append(form)
+            if conllu:
+                misc = row[9].split("|") if len(row) > 9 else ()
+                spaces.append("SpaceAfter=No" not in misc and
+                              "SpacesAfter=No" not in misc)
+            else:
+                spaces.append(True)
+            values.append((string_ids[lemma],
+                           spacy.parts_of_speech.IDS.get(pos, 0),
+                           string_ids[tag],
+                           string_ids[dep]))
+            # heads are stored relative to the token; the root is its own
+            # head
+            head = int(head) if head != "_" else 0
+            heads.append(head - 1 - j if head else 0)
+    n = len(words)
+    array = np.zeros((n, len(_CONLL_READ_ATTRS)), dtype=np.uint64)
+    if n:
+        values = np.array(values, dtype=np.uint64)
+        array[:, [0, 1, 2, 4]] = values
+        array[:, 3] = np.array(heads, dtype=np.int64).astype(np.uint64)
+    return doc_from_tuple(vocab, (words, spaces, _CONLL_READ_ATTRS, array))
+
+
+def _read_conll(vocab, file, per_sentence, conllu):
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "r", encoding="utf-8") as fs:
+            yield from _read_conll(vocab, fs, per_sentence, conllu)
+        return
+    string_ids = _StringIds(vocab.strings)
+    sents = []
+    seen_newdoc = False
+    for comments, rows in _iter_conll_blocks(file):
+        newdoc = any(x.startswith("# newdoc") for x in comments)
+        seen_newdoc = seen_newdoc or newdoc
+        if per_sentence is None:
+            # until a newdoc comment is seen, each sentence is a document
+            split = not seen_newdoc
+        else:
+            split = per_sentence
+        if sents and (split or newdoc):
+            yield _conll_doc(vocab, sents, string_ids, conllu=conllu)
+            sents = []
+        if rows:
+            sents.append(rows)
+    if sents:
+        yield _conll_doc(vocab, sents, string_ids, conllu=conllu)
+
+
+def read_conllu(vocab, file, per_sentence=None):
+    """Read SpaCy documents from a CONLL-U file.
+
+    The file is read lazily, and each document is created with
+    ``Doc(...).from_array`` from the LEMMA, UPOSTAG, XPOSTAG, HEAD, and
+    DEPREL columns, as in :func:`doc_from_tuple`. Multiword tokens and
+    empty nodes are ignored, and ``SpaceAfter=No`` in the MISC column is
+    used for the whitespace after tokens. This reads files written by
+    :func:`to_conllu` and :func:`write_conllu`, except that whitespace
+    tokens are not restored.
+
+    Parameters
+    -----------
+    vocab: :py:class:`spacy.vocab.Vocab`
+        The vocab used to create the documents
+    file: str or file
+        A path or a file object opened in text mode.
+    per_sentence: bool, optional
+        If ``True``, yield a document for each sentence. If ``False``,
+        sentences are grouped into documents at ``# newdoc`` comments. If
+        ``None``, sentences are grouped at ``# newdoc`` comments once the
+        first one is seen, and before that each sentence is a document,
+        so files without the comments are not read as one document.
+
+    Yields
+    -------
+    :py:class:`spacy.tokens.Doc`
+        A SpaCy document
+
+    """
+    return _read_conll(vocab, file, per_sentence, conllu=True)
+
+
+def read_conllx(vocab, file, per_sentence=None):
+    """Read SpaCy documents from a CONLL-X file.
+
+    This is like :func:`read_conllu`, but for the CONLL-X 2006 format,
+    as written by :func:`to_conllx`. The CPOSTAG column is used for the
+    coarse-grained POS and the POSTAG column for the fine-grained tag.
+    Since the format has no whitespace information, all tokens are
+    followed by a space. The format also has no ``# newdoc`` comments, so
+    by default each sentence is a document.
+
+    """
+    return _read_conll(vocab, file, per_sentence, conllu=False)
+
+
+# Bracket NER format
+
+_RE_BRACKET_ENT = re.compile(r"(\t?)\[(\S+) (.*?) \](\t?)")
+_RE_BRACKET_TOKEN = re.compile(r"\S+")
+_WHITESPACE_TO_SPACE = str.maketrans("\t\r\n", "   ")
+# separates brackets from adjacent characters of the text. A tab is used,
+# rather than a space, so that the reader can tell it from the text.
+_BRACKET_PAD = "\t"
+
+
+def _bracket_ner(doc, table=None):
+    """Return the text of a document in bracket tagged NER format.
+
+    If ``table`` is given, the text is translated with it before the
+    entity brackets are added.
+
+    """
+    text = doc.text
+    if table is not None:
+        text = text.translate(table)
+    pieces = []
+    pos = 0
+    for ent in doc.ents:
+        pieces.append(text[pos:ent.start_char])
+        # keep the brackets separated from the adjacent tokens
+        if ent.start_char > 0 and not text[ent.start_char - 1].isspace():
+            pieces.append(_BRACKET_PAD)
+        pieces.append(f"[{ent.label_} {ent.text} ]")
+        if ent.end_char < len(text) and not text[ent.end_char].isspace():
+            pieces.append(_BRACKET_PAD)
+        pos = ent.end_char
+    pieces.append(text[pos:])
+    return "".join(pieces)
 
 
 def to_bracket_ner(doc, fs):
@@ -175,12 +1096,165 @@ def to_bracket_ner(doc, fs):
 
     This is the output format of the
     `Illinois tagger <https://github.com/danyaljj/illinois-cogcomp-nlp-1/tree/master/ner>`__.
+    Entities are written as ``[LABEL text of entity ]``, using the character
+    offsets of ``doc.ents``, and the document is written with a single
+    write. If the character before or after an entity is not whitespace,
+    a tab is added between it and the bracket, so the entity is a separate
+    token when the text is split on whitespace. :func:`read_bracket_ner`
+    removes these tabs.
 
     """  # noqa
-    for tok in doc:
-        if tok.ent_iob_ == "B":
-            fs.write(f"[{tok.ent_type_} ")
-        elif tok.i > 0 and tok.ent_iob_ == "O":
-            if _prev_tok(tok).ent_iob_ != "O":
-                fs.write(" ] ")
-        fs.write(tok.text_with_ws)
+    fs.write(_bracket_ner(doc))
+
+
+def write_bracket_ner(docs, file, buffer_size=2 ** 16):
+    """Write multiple documents in bracket tagged NER format.
+
+    Each document is written on one line, with new lines and tabs in the
+    text replaced by spaces, so the file can be read with
+    :func:`read_bracket_ner`. Output is buffered and written in chunks of
+    about ``buffer_size`` characters.
+
+    Parameters
+    -----------
+    docs: iterable of :py:class:`spacy.tokens.Doc`
+        SpaCy documents
+    file: str or file
+        A path or a file object opened in text mode.
+    buffer_size: int
+        Number of characters to buffer before writing.
+
+    Returns
+    --------
+    int
+        The number of documents written.
+
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "w", encoding="utf-8") as fs:
+            return write_bracket_ner(docs, fs, buffer_size=buffer_size)
+    buffer = []
+    size = 0
+    n = 0
+    for doc in docs:
+        line = _bracket_ner(doc, _WHITESPACE_TO_SPACE) + "\n"
+        buffer.append(line)
+        size += len(line)
+        n += 1
+        if size >= buffer_size:
+            file.write("".join(buffer))
+            buffer = []
+            size = 0
+    if buffer:
+        file.write("".join(buffer))
+    return n
+
+
+def _parse_bracket_ner(line):
+    """Remove entity brackets from a line.
+
+    Returns the text without brackets or the tabs separating them from the
+    text, and a list of the start and end characters and labels of the
+    entities in it.
+
+    """
+    pieces = []
+    ents = []
+    pos = 0
+    length = 0
+    for m in _RE_BRACKET_ENT.finditer(line):
+        before = line[pos:m.start()]
+        pieces.append(before)
+        length += len(before)
+        ent_text = m.group(3)
+        ents.append((length, length + len(ent_text), m.group(2)))
+        pieces.append(ent_text)
+        length += len(ent_text)
+        pos = m.end()
+    pieces.append(line[pos:])
+    return "".join(pieces), ents
+
+
+def _split_words(text, bounds):
+    """Split text on whitespace and at the character offsets in ``bounds``.
+
+    Returns the words, and arrays of their start and end characters.
+
+    """
+    bounds = np.unique(np.asarray(bounds, dtype=np.int64))
+    words = []
+    starts = []
+    ends = []
+    for m in _RE_BRACKET_TOKEN.finditer(text):
+        start, end = m.span()
+        cuts = bounds[np.searchsorted(bounds, start, side="right"):
+                      np.searchsorted(bounds, end, side="left")].tolist()
+        for word_start, word_end in zip([start] + cuts, cuts + [end]):
+            words.append(text[word_start:word_end])
+            starts.append(word_start)
+            ends.append(word_end)
+    return (words, np.array(starts, dtype=np.int64),
+            np.array(ends, dtype=np.int64))
+
+
+def read_bracket_ner(vocab, file, tokenizer=None):
+    """Read documents in bracket tagged NER format.
+
+    Each non-empty line of the file is read as a document, as written by
+    :func:`write_bracket_ner`. The entities are set with ``ENT_IOB`` and
+    ``ENT_TYPE`` arrays. The tabs that the writers add between brackets
+    and adjacent characters are removed. Entities that do not align with
+    token boundaries are extended to the tokens that overlap them.
+
+    Parameters
+    -----------
+    vocab: :py:class:`spacy.vocab.Vocab`
+        The vocab used to create the documents
+    file: str or file
+        A path or a file object opened in text mode.
+    tokenizer: callable, optional
+        A function that returns a SpaCy document from text, e.g.
+        ``nlp.tokenizer``. If ``None``, the text is split on whitespace and
+        at the starts and ends of entities.
+
+    Yields
+    -------
+    :py:class:`spacy.tokens.Doc`
+        A SpaCy document
+
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "r", encoding="utf-8") as fs:
+            yield from read_bracket_ner(vocab, fs, tokenizer=tokenizer)
+        return
+    string_ids = _StringIds(vocab.strings)
+    for line in file:
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        text, ents = _parse_bracket_ner(line)
+        if tokenizer is None:
+            words, starts, ends = _split_words(
+                text, [x for start, end, _ in ents for x in (start, end)])
+            spaces = np.ones(len(words), dtype=bool)
+            spaces[:-1] = ends[:-1] < starts[1:]
+            if len(words):
+                spaces[-1] = ends[-1] < len(text)
+            doc = Doc(vocab, words=words, spaces=spaces.tolist())
+        else:
+            doc = tokenizer(text)
+            starts = doc.to_array([spacy.attrs.IDX]).astype(np.int64)
+            ends = starts + doc.to_array([spacy.attrs.LENGTH])
+        array = np.zeros((len(doc), 2), dtype=np.uint64)
+        array[:, 0] = 2
+        for start_char, end_char, label in ents:
+            # tokens overlapping the entity
+            start = np.searchsorted(ends, start_char, side="right")
+            end = np.searchsorted(starts, end_char, side="left")
+            if start >= end:
+                continue
+            array[start, 0] = 3
+            array[start + 1:end, 0] = 1
+            array[start:end, 1] = string_ids[label]
+        yield doc.from_array([spacy.attrs.ENT_IOB, spacy.attrs.ENT_TYPE],
+                             array)
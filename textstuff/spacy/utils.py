@@ -1,10 +1,17 @@
 """Utility functions and classes for working with SpaCy."""
+import collections
 import logging
 import re
+import weakref
 
+import numpy as np
 import spacy
+from spacy.attrs import ENT_IOB, ENT_TYPE, ORTH, POS, SPACY
+from spacy.symbols import SPACE
 from spacy.tokens import Doc, Span
 
+from ..utils import TAG_B, TAG_I, TAG_O, bio2biolu_array, biolu2bio_array
+
 LOGGER = logging.getLogger(__name__)
 
 DEFAULT_ATTRS = [
@@ -77,6 +84,235 @@ def doc_copy(doc):
     return Doc(doc.vocab).from_bytes(doc.to_bytes())
 
 
+SPAN_KINDS = ("sents", "ents", "noun_chunks", "lines", "paras")
+"""Kinds of spans indexed by :class:`SpanIndex`."""
+
+
+class SpanIndex:
+    """Token to span lookup tables for a SpaCy document.
+
+    Finding the span containing a token by scanning ``doc.sents``,
+    ``doc.ents``, etc. is linear in the size of the document, so doing it for
+    every token is quadratic. A ``SpanIndex`` builds, once per document and
+    kind of span, an array mapping each token number to the number of the
+    span containing it (or ``-1``), along with arrays of the span starts and
+    ends. After that, lookups are constant time.
+
+    Tables are built lazily the first time a kind of span is used. The
+    kinds of spans are those in :data:`SPAN_KINDS`: sentences (``"sents"``),
+    named entities (``"ents"``), noun chunks (``"noun_chunks"``), lines
+    (``"lines"``), and paragraphs (``"paras"``). All kinds of spans are
+    assumed to be non-overlapping.
+
+    The index is not updated if the document is modified, e.g. by merging
+    tokens or setting ``doc.ents``.
+
+    Functions like :func:`find_sent` or :func:`sent_token_i` take an
+    ``index`` argument. If it is ``None``, they use tables that are built
+    the first time they are needed and cached for the document, and
+    rebuilt if the number of tokens changes. Named entities are never
+    taken from the cache; without an index, the entity functions use the
+    ``ENT_IOB`` attributes of the tokens, so they follow changes to
+    ``doc.ents``.
+
+    Parameters
+    -----------
+    doc: :py:class:`~spacy.tokens.Doc`
+        Spacy document
+
+    """
+
+    def __init__(self, doc, _tables=None):
+        self.doc = doc
+        self.n_tokens = len(doc)
+        # tables hold no reference to the document, so they can be cached
+        # in _DOC_TABLES without keeping the document alive
+        self._tables = {} if _tables is None else _tables
+
+    def _iter_spans(self, kind):
+        if kind == "sents":
+            return self.doc.sents
+        elif kind == "ents":
+            return self.doc.ents
+        elif kind == "noun_chunks":
+            return self.doc.noun_chunks
+        elif kind == "lines":
+            return line_spans(self.doc)
+        elif kind == "paras":
+            return para_spans(self.doc)
+        raise ValueError(f"kind must be one of {SPAN_KINDS}: {kind!r}")
+
+    def _build(self, kind):
+        if kind in self._tables:
+            return self._tables[kind]
+        spans = list(self._iter_spans(kind))
+        n = len(spans)
+        starts = np.fromiter((span.start for span in spans), dtype=np.int64,
+                             count=n)
+        ends = np.fromiter((span.end for span in spans), dtype=np.int64,
+                           count=n)
+        labels = np.fromiter((span.label for span in spans), dtype=np.uint64,
+                             count=n)
+        kb_ids = np.fromiter((span.kb_id for span in spans),
+                             dtype=np.uint64, count=n)
+        ids, _ = _span_positions(starts, ends, len(self.doc))
+        table = _SpanTable(ids, starts, ends, labels, kb_ids)
+        self._tables[kind] = table
+        return table
+
+    def _span(self, kind, i):
+        table = self._tables[kind]
+        return Span(self.doc, int(table.starts[i]), int(table.ends[i]),
+                    label=int(table.labels[i]), kb_id=int(table.kb_ids[i]))
+
+    def spans(self, kind):
+        """Return the list of spans of a kind."""
+        n = len(self._build(kind).starts)
+        return [self._span(kind, i) for i in range(n)]
+
+    def span_ids(self, kind):
+        """Return an array with the span number of each token.
+
+        Tokens that are not in a span of that kind have a value of ``-1``.
+
+        """
+        return self._build(kind).ids
+
+    def starts(self, kind):
+        """Return an array with the first token number of each span."""
+        return self._build(kind).starts
+
+    def ends(self, kind):
+        """Return an array with one past the last token number of each span."""
+        return self._build(kind).ends
+
+    def span_id(self, tok, kind):
+        """Return the number of the span containing a token, or ``None``.
+
+        If ``tok`` is a span, then its root token is used.
+
+        """
+        if isinstance(tok, Span):
+            tok = tok.root
+        i = self.span_ids(kind)[tok.i]
+        return None if i < 0 else int(i)
+
+    def find(self, tok, kind):
+        """Find the span of a kind in which a token appears.
+
+        Returns
+        --------
+        (int, :class:`spacy.tokens.Span`) or None
+            A tuple with the span number and span, or ``None`` if the token
+            is not in a span of that kind.
+
+        """
+        i = self.span_id(tok, kind)
+        if i is None:
+            return None
+        return (i, self._span(kind, i))
+
+    def contains(self, tok, kind):
+        """Is the token in a span of a kind."""
+        return self.span_id(tok, kind) is not None
+
+    def is_start(self, tok, kind):
+        """Does the token (or the first token of a span) start a span."""
+        tok = _first_token(tok)
+        table = self._build(kind)
+        i = table.ids[tok.i]
+        return bool(i >= 0 and table.starts[i] == tok.i)
+
+    def is_end(self, tok, kind):
+        """Does the token (or the last token of a span) end a span."""
+        tok = _last_token(tok)
+        table = self._build(kind)
+        i = table.ids[tok.i]
+        return bool(i >= 0 and table.ends[i] == tok.i + 1)
+
+    def token_i(self, tok, kind):
+        """Token number within the span containing it, or ``None``."""
+        tok = _first_token(tok)
+        table = self._build(kind)
+        i = table.ids[tok.i]
+        if i < 0:
+            return None
+        return int(tok.i - table.starts[i])
+
+
+_SpanTable = collections.namedtuple(
+    "_SpanTable", ("ids", "starts", "ends", "labels", "kb_ids"))
+
+
+def _span_positions(starts, ends, n):
+    """Return arrays with the span number and position within span of tokens.
+
+    Both arrays have length ``n``, and are ``-1`` for tokens not in a span.
+
+    """
+    ids = np.full(n, -1, dtype=np.int64)
+    token_i = np.full(n, -1, dtype=np.int64)
+    lengths = ends - starts
+    span_i = np.repeat(np.arange(len(starts)), lengths)
+    # offset of each token from the start of its span
+    offsets = (np.arange(lengths.sum()) -
+               np.repeat(np.cumsum(lengths) - lengths, lengths))
+    pos = starts[span_i] + offsets
+    ids[pos] = span_i
+    token_i[pos] = offsets
+    return ids, token_i
+
+
+# span tables of documents used when no index is given, as
+# ``(n_tokens, tables)``. They are not stored in ``doc.user_data``, since
+# that is serialized with the document.
+_DOC_TABLES = weakref.WeakKeyDictionary()
+
+
+def _get_index(tok, index=None):
+    """Return ``index``, or an index using the document's cached tables."""
+    if index is not None:
+        return index
+    doc = tok.doc
+    n_tokens, tables = _DOC_TABLES.get(doc, (None, None))
+    if n_tokens != len(doc):
+        tables = {}
+        _DOC_TABLES[doc] = (len(doc), tables)
+    return SpanIndex(doc, tables)
+
+
+def _ent_bounds(tok):
+    """Return the start and end of the named entity containing a token.
+
+    The entity is found from the ``ENT_IOB`` attributes of the neighbouring
+    tokens, so this takes time proportional to the length of the entity.
+    Returns ``None`` if the token is not in an entity.
+
+    """
+    if tok.ent_iob_ not in ("B", "I"):
+        return None
+    doc = tok.doc
+    start = tok.i
+    while start > 0 and doc[start].ent_iob_ == "I":
+        start -= 1
+    end = tok.i + 1
+    while end < len(doc) and doc[end].ent_iob_ == "I":
+        end += 1
+    return start, end
+
+
+def _first_token(tok):
+    if isinstance(tok, Span):
+        return tok[0]
+    return tok
+
+
+def _last_token(tok):
+    if isinstance(tok, Span):
+        return tok[-1]
+    return tok
+
+
 def find_spans(tok, spans):
     """Get any spans in which a token appears.
 
@@ -128,7 +364,7 @@ def find_first_span(tok, spans):
         return None
 
 
-def find_ent(tok):
+def find_ent(tok, index=None):
     """Find the named entity span in which a token appears.
 
     Parameters
@@ -136,6 +372,9 @@ def find_ent(tok):
     tok: :class:`spacy.tokens.Token`, :class:`spacy.token.Span`
         A SpaCy token or span. If ``tok`` is a span, then its root token is
         used.
+    index: :class:`SpanIndex`, optional
+        A span index of ``tok.doc``. If ``None``, the entity is found from
+        the ``ENT_IOB`` attributes of the tokens. See :class:`SpanIndex`.
 
     Returns
     --------
@@ -145,15 +384,22 @@ def find_ent(tok):
         function returns ``None``.
 
     """
+    if index is not None:
+        return index.find(tok, "ents")
     if isinstance(tok, Span):
         tok = tok.root
-    if tok.ent_iob_ is None or tok.ent_iob_ == "O":
+    bounds = _ent_bounds(tok)
+    if bounds is None:
         return None
-    else:
-        return find_first_span(tok, tok.doc.ents)
+    start, end = bounds
+    doc = tok.doc
+    i = int(np.count_nonzero(doc.to_array(ENT_IOB)[:start] == _IOB_B))
+    first = doc[start]
+    return (i, Span(doc, start, end, label=first.ent_type,
+                    kb_id=first.ent_kb_id))
 
 
-def find_noun_chunk(tok):
+def find_noun_chunk(tok, index=None):
     """Find the noun-chunk in which a token appears.
 
     Parameters
@@ -161,6 +407,9 @@ def find_noun_chunk(tok):
     tok: :class:`spacy.tokens.Token`, :class:`spacy.token.Span`
         A SpaCy token or span. If ``tok`` is a span, then its root token is
         used.
+    index: :class:`SpanIndex`, optional
+        A span index of ``tok.doc``. If ``None``, the index cached for the
+        document is used.
 
     Returns
     --------
@@ -170,12 +419,10 @@ def find_noun_chunk(tok):
         function returns ``None``.
 
     """
-    if isinstance(tok, Span):
-        tok = tok.root
-    return find_first_span(tok, tok.doc.noun_chunks)
+    return _get_index(tok, index).find(tok, "noun_chunks")
 
 
-def find_sent(tok):
+def find_sent(tok, index=None):
     """Find the sentence in which the token appears.
 
     Parameters
@@ -183,6 +430,9 @@ def find_sent(tok):
     tok: :class:`spacy.tokens.Token`, :class:`spacy.token.Span`
         A SpaCy token or span. If ``tok`` is a span, then its root token is
         used.
+    index: :class:`SpanIndex`, optional
+        A span index of ``tok.doc``. If ``None``, the index cached for the
+        document is used.
 
     Returns
     --------
@@ -192,9 +442,7 @@ def find_sent(tok):
         function returns ``None``.
 
     """
-    if isinstance(tok, Span):
-        tok = tok.root
-    return find_first_span(tok, tok.doc.sents)
+    return _get_index(tok, index).find(tok, "sents")
 
 
 def remove_leading(predicate, span):
@@ -408,21 +656,29 @@ def tokens_to_spans(tokens):
     return Span(tok.doc, start, end + 1)
 
 
-# Check whether tokens start spans
+# Check whether tokens are in spans
 
 def in_span(tok, spans):
     """Is token ``tok`` in a span in ``spans``."""
     return find_first_span(tok, spans) is not None
 
 
-def in_ent(tok):
+def in_ent(tok, index=None):
     """Is the token in an entity."""
-    return tok.ent_iob_ and tok.ent_iob_ != "O"
+    if index is None:
+        if isinstance(tok, Span):
+            tok = tok.root
+        return tok.ent_iob_ in ("B", "I")
+    return index.contains(tok, "ents")
 
 
-def in_noun_chunk(tok, spans):
-    """Is token ``tok`` in a span in ``spans``."""
-    return find_first_span(tok, tok.doc.noun_chunks) is not None
+def in_noun_chunk(tok, spans=None, index=None):
+    """Is the token in a noun chunk.
+
+    ``spans`` is ignored, and only kept for backwards compatibility.
+
+    """
+    return _get_index(tok, index).contains(tok, "noun_chunks")
 
 # since sentences either partition the doc or don't exist, no need for fun
 
@@ -435,31 +691,40 @@ def is_span_start(tok, spans):
     If ``tok`` is in multiple spans in ``Span``.
 
     """
-    span = find_first_span(tok, spans)
-    if span is None:
+    found = find_first_span(tok, spans)
+    if found is None:
         return False
-    if isinstance(tok, Span):
-        return tok.start == span.start
-    else:
-        return tok.i == tok.start
+    _, span = found
+    return _first_token(tok).i == span.start
 
 
-def is_ent_start(tok, spans):
-    """Does token start a named entity."""
-    if isinstance(tok, Span):
-        return tok.doc[tok.start] == "B"
-    else:
-        return tok.ent_iob_ == "B"
+def is_ent_start(tok, spans=None, index=None):
+    """Does token start a named entity.
+
+    ``spans`` is ignored, and only kept for backwards compatibility.
+
+    """
+    if index is None:
+        return _first_token(tok).ent_iob_ == "B"
+    return index.is_start(tok, "ents")
+
 
+def is_noun_chunk_start(tok, spans=None, index=None):
+    """Does token start a noun chunk.
 
-def is_noun_chunk_start(tok, spans):
-    """Does token start a noun chunk."""
-    return is_span_start(tok, tok.doc.noun_chunks)
+    ``spans`` is ignored, and only kept for backwards compatibility.
 
+    """
+    return _get_index(tok, index).is_start(tok, "noun_chunks")
+
+
+def is_sent_start(tok, spans=None, index=None):
+    """Does token start a sentence.
 
-def is_sent_start(tok, spans):
-    """Does token start a sentence."""
-    return is_span_start(tok, tok.doc.sents)
+    ``spans`` is ignored, and only kept for backwards compatibility.
+
+    """
+    return _get_index(tok, index).is_start(tok, "sents")
 
 
 def is_doc_start(tok):
@@ -473,41 +738,30 @@ def is_doc_start(tok):
 # Check whether tokens end spans
 
 def is_span_end(tok, span):
-    """Does token start a span from an iterable in spans.
-
-    If ``tok`` is in multiple spans in ``Span``.
-
-    """
-    if isinstance(tok, Span):
-        return tok.end == span.end
-    if span:
-        return tok.i == (span.end - 1)
-    return False
+    """Does token end the span ``span``."""
+    if span is None:
+        return False
+    return _last_token(tok).i == (span.end - 1)
 
 
-def is_ent_end(tok):
+def is_ent_end(tok, index=None):
     """Does token end a named entity."""
-    if isinstance(tok, Span):
-        tok = tok.doc[tok.end]
-    if tok.ent_iob_ is None or tok.ent_iob_ == "O":
-        return False
-    else:
-        try:
-            return tok.nbor(1).ent_iob_ == "B"
-        except IndexError:  # end of document
-            return True
+    if index is None:
+        tok = _last_token(tok)
+        if tok.ent_iob_ not in ("B", "I"):
+            return False
+        return tok.i == len(tok.doc) - 1 or tok.nbor(1).ent_iob_ != "I"
+    return index.is_end(tok, "ents")
 
 
-def is_noun_chunk_end(tok):
-    """Does token start a noun chunk."""
-    _, span = find_first_span(tok, tok.doc.noun_chunks)
-    return is_span_end(tok, span)
+def is_noun_chunk_end(tok, index=None):
+    """Does token end a noun chunk."""
+    return _get_index(tok, index).is_end(tok, "noun_chunks")
 
 
-def is_sent_end(tok):
-    """Does token start a sentence."""
-    _, span = find_first_span(tok, tok.doc.sents)
-    return is_span_end(tok, span)
+def is_sent_end(tok, index=None):
+    """Does token end a sentence."""
+    return _get_index(tok, index).is_end(tok, "sents")
 
 
 def is_doc_end(tok):
@@ -554,22 +808,25 @@ def span_token_i(tok, span):
         return tok.i - span.start
 
 
-def ent_token_i(tok):
+def ent_token_i(tok, index=None):
     """Token number within a named entity if in one."""
-    _, span = find_ent(tok)
-    return span_token_i(tok, span)
+    if index is not None:
+        return index.token_i(tok, "ents")
+    tok = _first_token(tok)
+    bounds = _ent_bounds(tok)
+    if bounds is None:
+        return None
+    return tok.i - bounds[0]
 
 
-def noun_chunk_token_i(tok):
-    """Token number within a span."""
-    _, span = find_noun_chunk(tok)
-    return span_token_i(tok, span)
+def noun_chunk_token_i(tok, index=None):
+    """Token number within a noun chunk if in one."""
+    return _get_index(tok, index).token_i(tok, "noun_chunks")
 
 
-def sent_token_i(tok):
+def sent_token_i(tok, index=None):
     """Token number within a sentence."""
-    _, span = find_sent(tok)
-    return span_token_i(tok, span)
+    return _get_index(tok, index).token_i(tok, "sents")
 
 # New lines
 
@@ -580,13 +837,12 @@ _RE_NEWLINE = re.compile("\n", re.M)
 def new_line(tok):
     """Is token a new line."""
     # actually returns number of new-lines in a token
-    return sum(len(_RE_NEWLINE.findall(tok.orth_)))
+    return len(_RE_NEWLINE.findall(tok.orth_))
 
 
 def is_line_start(tok):
     """Is token at the start of a line."""
-    if isinstance(tok, Span):
-        tok = tok.doc[tok.start]
+    tok = _first_token(tok)
     if tok.i == 0:
         return True
     else:
@@ -594,37 +850,36 @@ def is_line_start(tok):
 
 
 def is_line_end(tok):
-    """Is token at the end of a line."""
-    if isinstance(tok, Span):
-        tok = tok.doc[tok.end]
+    """Is token at the end of a line.
+
+    As in :func:`line_spans`, a line ends with the token containing the new
+    line, or the last token of the document.
+
+    """
+    tok = _last_token(tok)
     if tok.i == (len(tok.doc) - 1):
         return True
     else:
-        return bool(new_line(tok.nbor(1)))
+        return bool(new_line(tok))
 
 
 def line_spans(doc):
     """Yield spans for each line in a document."""
     line_num = 0
-    start = None
-    end = None
-    new_line = True
+    start = 0
     for tok in doc:
-        if new_line:
-            start = tok.i  # using this means doc can be a span
-            new_line = False
         if new_line(tok):
-            end = tok.i + 1
-            yield Span(doc, start, end, label=f"Line {linenum}")
+            yield Span(doc, start, tok.i + 1, label=f"Line {line_num}")
             line_num += 1
-            new_line = True
-    # return last line
-    return Span(doc, start, end, label=f"Line {linenum}")
+            start = tok.i + 1
+    # last line, if the document does not end with a new line
+    if start < len(doc):
+        yield Span(doc, start, len(doc), label=f"Line {line_num}")
 
 
-def find_line(tok):
+def find_line(tok, index=None):
     """Return line of a token."""
-    return find_first_span(tok, line_spans(tok.doc))
+    return _get_index(tok, index).find(tok, "lines")
 
 
 # Paragraphs
@@ -640,8 +895,7 @@ def is_new_para(tok):
 
 def para_start(tok):
     """Is the token the start of a paragraph."""
-    if isinstance(tok, Span):
-        tok = tok.doc[tok.start]
+    tok = _first_token(tok)
     if tok.i == 0:
         return True
     else:
@@ -649,34 +903,338 @@ def para_start(tok):
 
 
 def para_end(tok):
-    """Is the token the end of a paragraph."""
-    if isinstance(tok, Span):
-        tok = tok.doc[tok.end]
+    """Is the token the end of a paragraph.
+
+    As in :func:`para_spans`, a paragraph ends with the token containing
+    the blank line, or the last token of the document.
+
+    """
+    tok = _last_token(tok)
     if tok.i == (len(tok.doc) - 1):
         return True
     else:
-        return is_new_para(tok.nbor(1))
+        return is_new_para(tok)
 
 
 def para_spans(doc):
-    """Yield spans for each line in a document."""
+    """Yield spans for each paragraph in a document."""
     para_num = 0
-    start = None
-    end = None
-    new_para = True
+    start = 0
     for tok in doc:
-        if new_para:
-            start = tok.i  # using this means doc can be a span
-            new_para = False
         if is_new_para(tok):
-            end = tok.i + 1
-            yield Span(doc, start, end, label=f"Para {para_num}")
-            para_num += 0
-            new_para = True
-    # return last line
-    return Span(doc, start, end, label=f"Para {para_num}")
+            yield Span(doc, start, tok.i + 1, label=f"Para {para_num}")
+            para_num += 1
+            start = tok.i + 1
+    # last paragraph, if the document does not end with a blank line
+    if start < len(doc):
+        yield Span(doc, start, len(doc), label=f"Para {para_num}")
 
 
-def find_para(tok):
+def find_para(tok, index=None):
     """Return paragraph of a token."""
-    return find_first_span(tok, para_spans(tok.doc))
+    return _get_index(tok, index).find(tok, "paras")
+
+
+# Whole-document features
+
+_SPAN_FEATURE_NAMES = {
+    "sents": "sent",
+    "ents": "ent",
+    "noun_chunks": "noun_chunk",
+    "lines": "line",
+    "paras": "para"
+}
+
+
+def _map_orth(doc, orth, func, dtype):
+    """Apply ``func`` to the text of each token, once per unique token."""
+    uniq, inverse = np.unique(orth, return_inverse=True)
+    strings = doc.vocab.strings
+    values = np.fromiter((func(strings[int(x)]) for x in uniq),
+                         dtype=dtype, count=len(uniq))
+    return values[inverse.reshape(-1)]
+
+
+def _breaks_to_bounds(breaks):
+    """Return span starts and ends for spans ending at ``breaks`` tokens."""
+    n = len(breaks)
+    ends = np.flatnonzero(breaks) + 1
+    if n and (not len(ends) or ends[-1] != n):
+        ends = np.append(ends, n)
+    starts = np.zeros(len(ends), dtype=np.int64)
+    starts[1:] = ends[:-1]
+    return starts, ends
+
+
+def token_features(doc, kinds=SPAN_KINDS, index=None):
+    """Compute token features for all tokens in a document.
+
+    This is a vectorized equivalent of calling functions like
+    :func:`is_sent_start`, :func:`is_ent_end`, :func:`sent_token_i`,
+    :func:`whitespace_after`, or :func:`is_line_start` on each token
+    of a document. The features are computed with array operations on
+    ``doc.to_array`` and span boundaries, rather than per-token function
+    calls.
+
+    For each kind of span in ``kinds`` with name ``name`` (``sent``,
+    ``ent``, ``noun_chunk``, ``line``, or ``para``) the features are
+
+    - ``in_{name}``: is the token in a span
+    - ``is_{name}_start``: does the token start a span
+    - ``is_{name}_end``: does the token end a span
+    - ``{name}_id``: the span number, or ``-1`` if not in a span
+    - ``{name}_token_i``: the token number within the span, or ``-1`` if not
+      in a span
+
+    Additionally, the features ``is_doc_start``, ``is_doc_end``,
+    ``whitespace_before``, ``whitespace_after``, and ``new_line`` (the
+    number of new lines in the token) are always returned.
+
+    Parameters
+    -----------
+    doc: :py:class:`~spacy.tokens.Doc`
+        Spacy document
+    kinds: iterable of str
+        Kinds of spans for which to compute features. See
+        :data:`SPAN_KINDS`. Sentences and noun chunks require a parsed
+        document.
+    index: :class:`SpanIndex`, optional
+        A span index of ``doc``. It is used for the sentence, named entity,
+        and noun chunk boundaries, and created if ``None``.
+
+    Returns
+    --------
+    dict
+        A dictionary mapping feature names to :py:class:`numpy.ndarray`
+        arrays with one element per token.
+
+    """
+    if index is None:
+        index = SpanIndex(doc)
+    n = len(doc)
+    arr = doc.to_array([ORTH, SPACY, POS]).reshape(n, 3)
+    orth = arr[:, 0]
+    spaces = arr[:, 1].astype(bool)
+    is_space = arr[:, 2] == SPACE
+    new_lines = _map_orth(doc, orth, lambda x: x.count("\n"), np.int64)
+    features = {}
+    features["is_doc_start"] = np.arange(n) == 0
+    features["is_doc_end"] = np.arange(n) == n - 1
+    # whitespace after a token is either trailing whitespace or a
+    # following whitespace token
+    ws_after = spaces.copy()
+    ws_after[:-1] |= is_space[1:]
+    features["whitespace_after"] = ws_after
+    ws_before = np.zeros(n, dtype=bool)
+    ws_before[1:] = spaces[:-1] | is_space[:-1]
+    features["whitespace_before"] = ws_before
+    features["new_line"] = new_lines
+    for kind in kinds:
+        if kind == "lines":
+            starts, ends = _breaks_to_bounds(new_lines > 0)
+        elif kind == "paras":
+            starts, ends = _breaks_to_bounds(_map_orth(
+                doc, orth, lambda x: bool(_RE_PARA_TOKEN.search(x)), bool))
+        else:
+            starts, ends = index.starts(kind), index.ends(kind)
+        name = _SPAN_FEATURE_NAMES[kind]
+        ids, token_i = _span_positions(starts, ends, n)
+        is_start = np.zeros(n, dtype=bool)
+        is_start[starts] = True
+        is_end = np.zeros(n, dtype=bool)
+        is_end[ends - 1] = True
+        features[f"in_{name}"] = ids >= 0
+        features[f"is_{name}_start"] = is_start
+        features[f"is_{name}_end"] = is_end
+        features[f"{name}_id"] = ids
+        features[f"{name}_token_i"] = token_i
+    return features
+
+
+# values of the ENT_IOB attribute
+_IOB_I = 1
+_IOB_O = 2
+_IOB_B = 3
+
+
+def _doc_offsets(lengths):
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def docs_to_biolu(docs):
+    """Return the BILOU tags of the named entities of documents.
+
+    The tags of all documents are computed at once from their ``ENT_IOB``
+    and ``ENT_TYPE`` arrays, without creating tokens.
+
+    Parameters
+    -----------
+    docs: iterable of :py:class:`~spacy.tokens.Doc`
+        Spacy documents
+
+    Returns
+    --------
+    prefixes: :py:class:`numpy.ndarray`
+        The codes of the BILOU prefixes of the tokens of all documents.
+        See :data:`textstuff.utils.TAG_O`.
+    types: :py:class:`numpy.ndarray`
+        The index of the entity type of each token in ``labels``.
+    labels: list of str
+        The entity types. The first is ``""``, for tokens not in an entity.
+    offsets: :py:class:`numpy.ndarray`
+        The offsets of the documents, such that the tags of document ``i``
+        are ``prefixes[offsets[i]:offsets[i + 1]]``.
+
+    The results can be converted to tags like ``"B-PERSON"`` with
+    :func:`textstuff.utils.decode_tags`.
+
+    """
+    vocab = None
+    arrays = []
+    for doc in docs:
+        vocab = doc.vocab
+        arrays.append(doc.to_array([ENT_IOB, ENT_TYPE]).reshape(-1, 2))
+    offsets = _doc_offsets([len(arr) for arr in arrays])
+    if arrays:
+        arr = np.concatenate(arrays)
+    else:
+        arr = np.zeros((0, 2), dtype=np.uint64)
+    iob = arr[:, 0]
+    bio = np.full(len(arr), TAG_O, dtype=np.int8)
+    bio[iob == _IOB_B] = TAG_B
+    bio[iob == _IOB_I] = TAG_I
+    # include 0, no entity type, so that it is always the first label
+    unique, types = np.unique(np.concatenate([[0], arr[:, 1]]),
+                              return_inverse=True)
+    types = types.reshape(-1)[1:]
+    labels = [vocab.strings[int(x)] if x else "" for x in unique.tolist()]
+    prefixes, _ = bio2biolu_array(bio, types, offsets)
+    return prefixes, types, labels, offsets
+
+
+def biolu_to_ent_array(prefixes, types, labels, strings, offsets=None):
+    """Convert BILOU tags to ``ENT_IOB`` and ``ENT_TYPE`` arrays.
+
+    Invalid sequences of tags are repaired as in
+    :func:`textstuff.utils.biolu2bio_array`.
+
+    Parameters
+    -----------
+    prefixes: array of int
+        The codes of the BILOU prefixes of the tags.
+    types: array of int
+        The index of the entity type of each tag in ``labels``.
+    labels: list of str
+        The entity types.
+    strings: :py:class:`~spacy.strings.StringStore`
+        The string store used to look up the ids of the entity types,
+        usually ``vocab.strings``. Missing types are added.
+    offsets: array of int, optional
+        The offsets of the documents. Entities do not continue across
+        documents. If ``None``, the tags are one document.
+
+    Returns
+    --------
+    :py:class:`numpy.ndarray`
+        An array with one row per tag, and the columns ``ENT_IOB`` and
+        ``ENT_TYPE``, that can be used with ``Doc.from_array``.
+
+    """
+    bio, _ = biolu2bio_array(prefixes, types, offsets)
+    label_ids = np.array([strings.add(label) if label else 0
+                          for label in labels], dtype=np.uint64)
+    arr = np.zeros((len(bio), 2), dtype=np.uint64)
+    arr[:, 0] = _IOB_O
+    arr[bio == TAG_B, 0] = _IOB_B
+    arr[bio == TAG_I, 0] = _IOB_I
+    in_ent = bio != TAG_O
+    arr[in_ent, 1] = label_ids[np.asarray(types)[in_ent]]
+    return arr
+
+
+def set_biolu_ents(docs, prefixes, types, labels, offsets):
+    """Set the named entities of documents from BILOU tags.
+
+    This is the inverse of :func:`docs_to_biolu`.
+
+    Parameters
+    -----------
+    docs: sequence of :py:class:`~spacy.tokens.Doc`
+        Spacy documents. Their entities are replaced.
+    prefixes: array of int
+        The codes of the BILOU prefixes of the tags.
+    types: array of int
+        The index of the entity type of each tag in ``labels``.
+    labels: list of str
+        The entity types.
+    offsets: array of int
+        The offsets of the documents, such that the tags of document ``i``
+        are ``prefixes[offsets[i]:offsets[i + 1]]``.
+
+    Returns
+    --------
+    list of :py:class:`~spacy.tokens.Doc`
+        The documents
+
+    """
+    docs = list(docs)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if len(offsets) != len(docs) + 1:
+        raise ValueError("offsets must have one more element than docs.")
+    if not docs:
+        return docs
+    arr = biolu_to_ent_array(prefixes, types, labels, docs[0].vocab.strings,
+                             offsets)
+    for doc, start, end in zip(docs, offsets[:-1].tolist(),
+                               offsets[1:].tolist()):
+        if end - start != len(doc):
+            raise ValueError("The number of tags does not match the number "
+                             "of tokens in the document.")
+        doc.from_array([ENT_IOB, ENT_TYPE], arr[start:end])
+    return docs
+
+
+def biolu_to_spans(prefixes, types=None, offsets=None):
+    """Return the entity spans of BILOU tags.
+
+    Invalid sequences of tags are repaired as in
+    :func:`textstuff.utils.biolu2bio_array`.
+
+    Parameters
+    -----------
+    prefixes: array of int
+        The codes of the BILOU prefixes of the tags.
+    types: array, optional
+        The entity types of the tags.
+    offsets: array of int, optional
+        The offsets of the documents. If ``None``, the tags are one
+        document.
+
+    Returns
+    --------
+    doc_ids: :py:class:`numpy.ndarray`
+        The document of each entity.
+    starts: :py:class:`numpy.ndarray`
+        The index of the first token of each entity in its document.
+    ends: :py:class:`numpy.ndarray`
+        The index after the last token of each entity in its document.
+    span_types: :py:class:`numpy.ndarray` or None
+        The type of each entity, or ``None`` if ``types`` is ``None``.
+
+    """
+    bio, _ = biolu2bio_array(prefixes, types, offsets)
+    n = len(bio)
+    starts = np.flatnonzero(bio == TAG_B)
+    # an entity ends where the next tag does not continue it
+    continues = np.zeros(n, dtype=bool)
+    continues[:-1] = bio[1:] == TAG_I
+    ends = np.flatnonzero((bio != TAG_O) & ~continues) + 1
+    if offsets is None:
+        offsets = np.array([0, n], dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    doc_ids = np.searchsorted(offsets, starts, side="right") - 1
+    span_types = None if types is None else np.asarray(types)[starts]
+    return (doc_ids, starts - offsets[doc_ids], ends - offsets[doc_ids],
+            span_types)
@@ -1,12 +1,27 @@
 """ Miscellaneous utility functions """
+import collections
+import functools
+import inspect
 import itertools
-import random
+import multiprocessing
+import os
+import pickle
 import re
+import tempfile
 
 import email_normalize
+import numpy as np
 import tldextract
 
-_CAMEL_CASE_PATTERN = r".+?(?:(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])|$)"
+_SENTINEL = object()
+
+# email_normalize 2.0 replaced ``resolve`` with ``skip_dns``, and returns a
+# result object instead of a string
+_EMAIL_NORMALIZE_SKIP_DNS = "skip_dns" in inspect.signature(
+    email_normalize.normalize).parameters
+
+_CAMEL_CASE_BOUNDARIES = [r"(?<=[a-z])(?=[A-Z])", r"(?<=[A-Z])(?=[A-Z][a-z])"]
+_DIGIT_BOUNDARIES = [r"(?<=[A-Za-z])(?=[0-9])", r"(?<=[0-9])(?=[A-Za-z])"]
 
 
 def normalize_email(email):
@@ -23,10 +38,167 @@ def normalize_email(email):
         The normalized email string
 
     """
+    if _EMAIL_NORMALIZE_SKIP_DNS:
+        return email_normalize.normalize(email,
+                                         skip_dns=True).normalized_address
     return email_normalize.normalize(email, resolve=False)
 
 
-def normalize_url(url):
+_PUBLIC_SUFFIX_LIST_PATH = os.path.join(os.path.dirname(__file__), "data",
+                                        "public_suffix_list.dat")
+
+# keys of the trie nodes which mark rules; labels are always strings
+_RULE = 0
+_EXCEPTION = 1
+
+_SCHEME_PATTERN = re.compile(r"^(?:[A-Za-z][A-Za-z0-9+.-]*:)?//")
+_IPV4_PATTERN = re.compile(r"^\d{1,3}(?:\.\d{1,3}){3}$")
+
+
+def _url_host(url):
+    """ Return the host name of a url
+
+    IPv6 addresses keep their brackets, as in :pkg:`tldextract`.
+
+    """
+    netloc = _SCHEME_PATTERN.sub("", url.strip(), count=1)
+    netloc = re.split(r"[/?#]", netloc, maxsplit=1)[0]
+    host = netloc.rpartition("@")[2]
+    if host.startswith("["):
+        return host.partition("]")[0] + "]"
+    return host.partition(":")[0].rstrip(".")
+
+
+class PublicSuffixList:
+    """ A trie of the rules of the Public Suffix List
+
+    See `<https://publicsuffix.org/>`__.
+
+    This splits host names into the subdomain, domain, and public suffix
+    without network access. Rules are stored with both their Unicode and
+    punycode labels, so that either form of a host name matches.
+
+    Parameters
+    -----------
+    path: str, optional
+        Path of a copy of ``public_suffix_list.dat``. If ``None``, the copy
+        included in this package is used.
+    private: bool
+        If ``True``, include the private domains section of the list,
+        e.g. ``blogspot.com``.
+
+    """
+
+    def __init__(self, path=None, private=False):
+        self.path = path or _PUBLIC_SUFFIX_LIST_PATH
+        self.private = private
+        self._root = {}
+        with open(self.path, "r", encoding="utf-8") as fs:
+            for line in fs:
+                line = line.strip()
+                if line.startswith("// ===BEGIN PRIVATE DOMAINS==="):
+                    if not private:
+                        break
+                if not line or line.startswith("//"):
+                    continue
+                # rules end at the first whitespace
+                self._add(line.split()[0])
+
+    def _add(self, rule):
+        exception = rule.startswith("!")
+        rule = rule.lstrip("!")
+        forms = {rule}
+        try:
+            forms.add(rule.encode("idna").decode("ascii"))
+        except UnicodeError:
+            pass
+        for form in forms:
+            node = self._root
+            for label in reversed(form.split(".")):
+                node = node.setdefault(label, {})
+            node[_EXCEPTION if exception else _RULE] = True
+
+    def suffix_length(self, labels):
+        """ Return the number of labels in the public suffix
+
+        Parameters
+        -----------
+        labels: list of str
+            The lower-case labels of a host name, e.g.
+            ``["www", "bbc", "co", "uk"]``.
+
+        Returns
+        --------
+        int
+            The number of labels at the end of ``labels`` which are the
+            public suffix. It is 0 if no rule matches.
+
+        """
+        node = self._root
+        length = 0
+        for depth, label in enumerate(reversed(labels), 1):
+            child = node.get(label)
+            wildcard = node.get("*")
+            if child is None and wildcard is None:
+                break
+            if child is not None and _EXCEPTION in child:
+                # the suffix is the exception rule without its first label
+                length = depth - 1
+                break
+            if wildcard is not None or _RULE in child:
+                length = depth
+            node = wildcard if child is None else child
+        return length
+
+    def split(self, host):
+        """ Split a host name
+
+        Parameters
+        -----------
+        host: str
+            A host name, e.g. ``"www.bbc.co.uk"``. Rules are matched
+            ignoring case.
+
+        Returns
+        --------
+        tuple of str
+            The subdomain, domain, and public suffix, e.g.
+            ``("www", "bbc", "co.uk")``, with the case of ``host``.
+
+        """
+        if _IPV4_PATTERN.match(host) or host.startswith("["):
+            return "", host, ""
+        labels = host.split(".")
+        n = self.suffix_length(host.lower().split("."))
+        if n == len(labels):
+            return "", "", host
+        i = len(labels) - n - 1
+        return (".".join(labels[:i]), labels[i], ".".join(labels[i + 1:]))
+
+
+_PUBLIC_SUFFIX_LIST = None
+
+
+def public_suffix_list():
+    """ Return the Public Suffix List included in this package
+
+    The list is loaded the first time this is called. Call it before
+    starting worker processes, so that forked workers share the loaded
+    list instead of loading it again.
+
+    Returns
+    --------
+    :class:`PublicSuffixList`
+        The ICANN section of the Public Suffix List
+
+    """
+    global _PUBLIC_SUFFIX_LIST
+    if _PUBLIC_SUFFIX_LIST is None:
+        _PUBLIC_SUFFIX_LIST = PublicSuffixList()
+    return _PUBLIC_SUFFIX_LIST
+
+
+def normalize_url(url, offline=False):
     """ Normalize a url
 
     Normalize a url by returning only its domain.
@@ -35,6 +207,11 @@ def normalize_url(url):
     ----------
     url: str
         A url
+    offline: bool
+        If ``True``, use the copy of the Public Suffix List included in this
+        package, instead of :pkg:`tldextract`, which may download the list.
+        This is also faster. Both keep the case of the url, and may differ
+        if their copies of the list differ.
 
     Returns
     --------
@@ -42,10 +219,207 @@ def normalize_url(url):
         The url's domain
 
     """
-    return '.'.join(tldextract.extract(url)[1:])
+    if offline:
+        return '.'.join(public_suffix_list().split(_url_host(url))[1:])
+    result = tldextract.extract(url)
+    return '.'.join((result.domain, result.suffix))
+
+
+def _normalize_url_offline(url):
+    return normalize_url(url, offline=True)
+
+
+class LRUCache:
+    """ A bounded mapping that discards the least recently used items
+
+    Lookups with :py:meth:`get` count hits and misses, so that the
+    usefulness of the cache can be checked.
+
+    Parameters
+    -----------
+    maxsize: int
+        The maximum number of items in the cache.
+
+    Attributes
+    -----------
+    hits: int
+        The number of lookups that found the key.
+    misses: int
+        The number of lookups that did not find the key.
+
+    """
+
+    def __init__(self, maxsize=2 ** 16):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        """ Return the value of ``key``, or ``default`` if it is not cached """
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        """ Remove all items and reset the statistics """
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return (f"{type(self).__name__}(hits={self.hits}, "
+                f"misses={self.misses}, maxsize={self.maxsize}, "
+                f"currsize={len(self)})")
+
+
+_EMAIL_CACHE = LRUCache()
+_URL_CACHE = LRUCache()
+_OFFLINE_URL_CACHE = LRUCache()
+
+
+def _cached(values, cache, compute):
+    """ Return results for values, computing unique values not in ``cache``
+
+    ``compute`` is called with a list of the values not in the cache and
+    returns their results in the same order.
+
+    """
+    results = dict.fromkeys(values)
+    missing = []
+    for value in results:
+        result = cache.get(value, _SENTINEL)
+        if result is _SENTINEL:
+            missing.append(value)
+        else:
+            results[value] = result
+    if missing:
+        for value, result in zip(missing, compute(missing)):
+            results[value] = result
+            cache[value] = result
+    return [results[value] for value in values]
+
+
+def _map_cached(func, values, cache, processes, chunksize):
+    """ Apply ``func`` to each unique value not in ``cache`` """
+    def compute(missing):
+        if processes is not None and len(missing) > chunksize:
+            with multiprocessing.Pool(processes) as pool:
+                return pool.map(func, missing, chunksize)
+        return map(func, missing)
+
+    return _cached(values, cache, compute)
+
+
+def normalize_emails(emails, cache=None, processes=None, chunksize=1024):
+    """ Normalize many emails
+
+    Each distinct email is normalized with :func:`normalize_email` once,
+    and the results are kept in a cache shared between calls.
+
+    Parameters
+    ------------
+    emails: iterable of str
+        Emails
+    cache: :class:`LRUCache`, optional
+        Cache of normalized emails. If ``None``, a module-level cache is
+        used.
+    processes: int, optional
+        If not ``None``, normalize emails in a pool of this many processes.
+    chunksize: int
+        The number of emails sent to a process at a time.
+
+    Returns
+    --------
+    list of str
+        The normalized emails, in the same order as ``emails``
+
+    Examples
+    ---------
+    >>> normalize_emails(["Foo.Bar+x@gmail.com", "foobar@GMAIL.com"])
+    ['foobar@gmail.com', 'foobar@gmail.com']
+
+    """
+    return _map_cached(normalize_email, list(emails),
+                       _EMAIL_CACHE if cache is None else cache,
+                       processes, chunksize)
+
 
+def normalize_urls(urls, cache=None, processes=None, chunksize=1024,
+                   offline=False):
+    """ Normalize many urls
 
-def split_camel_case(string):
+    Each distinct url is normalized with :func:`normalize_url` once,
+    and the results are kept in a cache shared between calls.
+
+    Parameters
+    ------------
+    urls: iterable of str
+        Urls
+    cache: :class:`LRUCache`, optional
+        Cache of normalized urls. If ``None``, a module-level cache is
+        used.
+    processes: int, optional
+        If not ``None``, normalize urls in a pool of this many processes.
+    chunksize: int
+        The number of urls sent to a process at a time.
+    offline: bool
+        See :func:`normalize_url`. Results are cached separately for
+        ``offline=True`` and ``offline=False``.
+
+    Returns
+    --------
+    list of str
+        The domains of the urls, in the same order as ``urls``
+
+    Examples
+    ---------
+    >>> normalize_urls(["http://www.bbc.co.uk/news", "https://bbc.co.uk"])
+    ['bbc.co.uk', 'bbc.co.uk']
+
+    """
+    if offline:
+        # load the list once, before any workers are forked
+        public_suffix_list()
+        func = _normalize_url_offline
+        default_cache = _OFFLINE_URL_CACHE
+    else:
+        func = normalize_url
+        default_cache = _URL_CACHE
+    return _map_cached(func, list(urls),
+                       default_cache if cache is None else cache,
+                       processes, chunksize)
+
+
+@functools.lru_cache(maxsize=None)
+def _camel_case_pattern(digits=False, underscores=False):
+    """ Return a compiled pattern matching the split points of words """
+    boundaries = list(_CAMEL_CASE_BOUNDARIES)
+    if digits:
+        boundaries += _DIGIT_BOUNDARIES
+    if underscores:
+        boundaries.append(r"_+")
+    return re.compile("|".join(boundaries))
+
+
+def split_camel_case(string, digits=False, underscores=False):
     """ Split Word on Camel Case
 
     Split word on internal uppercase letters, but allowing for sequences of
@@ -55,31 +429,176 @@ def split_camel_case(string):
     -----------
     string: str
         The string to split
+    digits: bool
+        If ``True``, also split between letters and digits.
+    underscores: bool
+        If ``True``, also split on underscores, which are removed.
 
     Returns
     --------
     list of str
         A list of strings after splitting the word
 
+    All characters of ``string`` are kept, except underscores if
+    ``underscores`` is ``True``. Before the ``digits`` and ``underscores``
+    options were added, text next to new lines could be dropped, e.g.
+    ``"\\n"`` gave ``[]``; it now gives ``["\\n"]``.
+
     This pattern is from this
     `stackoverflow <https://stackoverflow.com/questions/29916065/how-to-do-camelcase-split-in-python>`__.
     answer.
 
     """  # noqa
-    return [m.group(0) for m in re.finditer(_CAMEL_CASE_PATTERN, string)]
+    parts = _camel_case_pattern(digits, underscores).split(string)
+    return [part for part in parts if part]
+
+
+# characters used to join strings and mark split points when splitting
+# many strings at once
+_JOIN_CHAR = "\x00"
+_SPLIT_CHAR = "\x01"
+
+
+def _split_camel_case_joined(strings, pattern):
+    """ Split many strings with one substitution over their concatenation """
+    joined = _JOIN_CHAR.join(strings)
+    if (_SPLIT_CHAR in joined
+            or joined.count(_JOIN_CHAR) != len(strings) - 1):
+        # the strings contain the special characters
+        return [tuple(part for part in pattern.split(string) if part)
+                for string in strings]
+    marked = pattern.sub(_SPLIT_CHAR, joined)
+    return [tuple(part for part in s.split(_SPLIT_CHAR) if part)
+            for s in marked.split(_JOIN_CHAR)]
+
+
+_CAMEL_CASE_CACHE = LRUCache()
+
+
+def split_camel_cases(strings, digits=False, underscores=False, cache=None):
+    """ Split many words on camel case
+
+    This gives the same results as :func:`split_camel_case` applied to each
+    string, but splits all distinct strings which are not in the cache with
+    one regular expression substitution.
+
+    Parameters
+    -----------
+    strings: iterable of str
+        The strings to split
+    digits: bool
+        If ``True``, also split between letters and digits.
+    underscores: bool
+        If ``True``, also split on underscores, which are removed.
+    cache: :class:`LRUCache`, optional
+        Cache of split strings. If ``None``, a module-level cache is used.
+
+    Returns
+    --------
+    list of list of str
+        The split strings, in the same order as ``strings``
+
+    """
+    pattern = _camel_case_pattern(digits, underscores)
+    if cache is None:
+        cache = _CAMEL_CASE_CACHE
+    # the options are part of the key, since the cache can be shared
+    keys = [(string, digits, underscores) for string in strings]
+
+    def compute(missing):
+        return _split_camel_case_joined([key[0] for key in missing], pattern)
+
+    return [list(parts) for parts in _cached(keys, cache, compute)]
+
+
+def random_generator(seed=None, *keys):
+    """ Return a NumPy random number generator
+
+    Parameters
+    -----------
+    seed: None, int, sequence of int, :py:class:`numpy.random.SeedSequence`, or :py:class:`numpy.random.Generator`
+        Seed of the generator. If it is a generator and there are no
+        ``keys``, it is returned as is; with ``keys``, a new generator is
+        derived from the seed sequence of the generator. If ``None``, the
+        generator is seeded with fresh entropy.
+    *keys: int
+        Keys used to derive an independent stream from the seed, e.g. the
+        epoch and worker numbers. Generators with the same seed and
+        different keys produce independent streams.
+
+    Returns
+    --------
+    :py:class:`numpy.random.Generator`
+        A random number generator
+
+    """  # noqa
+    if isinstance(seed, np.random.Generator):
+        if not keys:
+            return seed
+        bit_generator = seed.bit_generator
+        seed_seq = getattr(bit_generator, "seed_seq",
+                           getattr(bit_generator, "_seed_seq", None))
+        if isinstance(seed_seq, np.random.SeedSequence):
+            seed = seed_seq
+        else:
+            # no seed sequence to derive streams from, so take entropy
+            # from the generator itself
+            seed = np.random.SeedSequence(
+                seed.integers(2 ** 63, size=4).tolist())
+    if isinstance(seed, np.random.SeedSequence):
+        seed_seq = np.random.SeedSequence(seed.entropy,
+                                          spawn_key=seed.spawn_key + keys)
+    else:
+        seed_seq = np.random.SeedSequence(seed, spawn_key=keys)
+    return np.random.default_rng(seed_seq)
+
+
+class _BufferedRandom:
+    """Draw scalar random numbers from a NumPy generator in batches.
+
+    Drawing single numbers from a :py:class:`numpy.random.Generator` is
+    slow, so this draws them in batches. The methods mirror those of
+    :py:class:`random.Random`.
+
+    """
+
+    def __init__(self, rng, size=1024):
+        self.rng = rng
+        self.size = size
+        self._buffer = []
+
+    def random(self):
+        """Return a random number in [0, 1)."""
+        if not self._buffer:
+            self._buffer = self.rng.random(self.size).tolist()
+        return self._buffer.pop()
+
+    def randrange(self, n):
+        """Return a random integer in [0, n)."""
+        return int(self.random() * n)
+
+    def uniform(self, a, b):
+        """Return a random number between a and b."""
+        return a + (b - a) * self.random()
+
+    def shuffle(self, x):
+        """Shuffle a list in place."""
+        x[:] = [x[i] for i in self.rng.permutation(len(x)).tolist()]
 
 
-def shuffle_iterable(iterable, n=None):
+def shuffle_iterable(iterable, n=None, seed=None):
     """ Shuffle an iterable
 
     Shuffle an interable. If ``n`` is ``None`` and the iterable is finite,
-    then this function puts the iterable into a list and shuffles it
-    with ``random.shuffle``, otherwise it raises a ``TypeError``.
+    then this function puts the iterable into a list and shuffles it,
+    otherwise it raises a ``TypeError``.
 
     If ``n`` is an integer, this function can shuffle even infinite iterables,
     by keeping a queue of ``n`` elements and randomly removing elements from
     it. If ``n = 1``, this is equivalent to iterating in order, and if
     ``n = len(iterable)`` it is equivalent to shuffling the entire sequence.
+    To uniformly shuffle an iterable that does not fit in memory, use
+    :func:`external_shuffle_iterable`.
 
 
     Parameters
@@ -88,6 +607,8 @@ def shuffle_iterable(iterable, n=None):
         An iterable
     n: int, None
         The size of the queue to use when shuffling.
+    seed: optional
+        Seed or NumPy random number generator. See :func:`random_generator`.
 
     Yields
     -------
@@ -102,16 +623,18 @@ def shuffle_iterable(iterable, n=None):
 
 
     """
+    rng = _BufferedRandom(random_generator(seed))
     # simple case: finite iterable, and n = length of iterable
     if n is None:
         # this is here to raise and error if no len for the iterable
         len(iterable)
         it = list(iterable)
-        random.shuffle(it)
+        rng.shuffle(it)
         for el in it:
             yield el
     else:
-        queue = list(itertools.islice(iterable, n))
+        it = iter(iterable)
+        queue = list(itertools.islice(it, n))
         empty = len(queue) < n
         # randomly select element from queue to remove
         # and replace with element from the iterable
@@ -119,22 +642,112 @@ def shuffle_iterable(iterable, n=None):
             # selecting and replacing by the index means that the queue does
             # not need to resized. If pop() used, then there is overhead
             # of resizing the queue
-            i = random.randrange(0, n)
+            i = rng.randrange(n)
             yield queue[i]
-            try:
-                queue[i] = next(iterable)
-            except StopIteration:
+            el = next(it, _SENTINEL)
+            if el is _SENTINEL:
                 # need to pop off the element which was already selected
                 # before the remaining queue is shuffled
                 queue.pop(i)
                 empty = True
+            else:
+                queue[i] = el
         # iterable has no other elements
         # shuffle the queue and yield remaining elements
-        random.shuffle(queue)
+        rng.shuffle(queue)
         for el in queue:
             yield el
 
 
+def _iter_serialized(file, serializer):
+    """Yield objects from a file until the end of the file."""
+    while True:
+        try:
+            yield serializer.load(file)
+        except EOFError:
+            return
+
+
+def _external_shuffle(iterable, n_buckets, max_bucket_size, serializer,
+                      dir, rng):
+    with tempfile.TemporaryDirectory(dir=dir) as tmpdir:
+        paths = [os.path.join(tmpdir, str(i)) for i in range(n_buckets)]
+        counts = [0] * n_buckets
+        files = [open(path, "wb") for path in paths]
+        try:
+            # first pass: scatter elements into buckets at random
+            for el in iterable:
+                i = rng.randrange(n_buckets)
+                serializer.dump(el, files[i])
+                counts[i] += 1
+        finally:
+            for fs in files:
+                fs.close()
+        # second pass: shuffle each bucket
+        for path, count in zip(paths, counts):
+            with open(path, "rb") as fs:
+                elements = _iter_serialized(fs, serializer)
+                if count > max_bucket_size:
+                    yield from _external_shuffle(elements, n_buckets,
+                                                 max_bucket_size, serializer,
+                                                 tmpdir, rng)
+                else:
+                    bucket = list(elements)
+                    rng.shuffle(bucket)
+                    yield from bucket
+            os.remove(path)
+
+
+def external_shuffle_iterable(iterable, max_bucket_size=100000, n_buckets=64,
+                              serializer=pickle, dir=None, seed=None):
+    """ Shuffle an iterable larger than memory using temporary files
+
+    Unlike :func:`shuffle_iterable`, this uniformly shuffles an iterable
+    without keeping it in memory, so it can shuffle generators and streams
+    larger than the available memory. It makes two passes. First, each
+    element is written to one of ``n_buckets`` temporary files chosen at
+    random. Then each bucket file is read, shuffled in memory, and its
+    elements yielded. Buckets with more than ``max_bucket_size`` elements are
+    shuffled the same way recursively, so at most ``max_bucket_size``
+    elements are kept in memory.
+
+    The temporary files are deleted after they have been read, or when the
+    generator is closed.
+
+    Parameters
+    -----------
+    iterable: iterabable
+        A finite iterable
+    max_bucket_size: int
+        The maximum number of elements to shuffle in memory. Must be at
+        least 1.
+    n_buckets: int
+        The number of temporary files to split the elements into. Must be
+        at least 2.
+    serializer:
+        An object with ``dump(obj, file)`` and ``load(file)`` functions
+        like :py:mod:`pickle`, used to write and read elements to binary
+        files. ``load`` must raise ``EOFError`` at the end of the file.
+    dir: str, optional
+        The directory in which to create the temporary files.
+    seed: optional
+        Seed or NumPy random number generator. See :func:`random_generator`.
+
+    Yields
+    -------
+    el:
+        An element from ``iterable`` in a random order
+
+    """
+    if n_buckets < 2:
+        raise ValueError("n_buckets must be at least 2.")
+    if max_bucket_size < 1:
+        raise ValueError("max_bucket_size must be at least 1.")
+    rng = _BufferedRandom(random_generator(seed))
+    return _external_shuffle(iterable, n_buckets, max_bucket_size,
+                             serializer, dir, rng)
+
+
 def bio2biolu(iterable):
     """Convert BIO tags to BILOU tags."""
     it = iter(iterable)
@@ -208,11 +821,250 @@ def biolu2bio(iterable):
             if lag and lag not in {"B", "I"}:
                 raise ValueError("'L' must follow 'B', or 'I'")
             else:
-                yield "L"
+                yield "I"
         elif x in {"U"}:
             if lag and lag not in {"L", "O", "U"}:
                 raise ValueError("'U' must follow 'L', 'O', or 'U'")
             else:
-                yield "L"
+                yield "B"
         else:
             raise ValueError
+
+
+# integer codes of the prefixes of BIO and BILOU tags
+TAG_O = 0
+TAG_B = 1
+TAG_I = 2
+TAG_L = 3
+TAG_U = 4
+
+_TAG_CODES = {"O": TAG_O, "B": TAG_B, "I": TAG_I, "L": TAG_L, "U": TAG_U}
+_TAG_PREFIXES = ["O", "B", "I", "L", "U"]
+
+
+def encode_tags(tags, sep="-"):
+    """ Encode BIO or BILOU tags as integer arrays
+
+    Parameters
+    -----------
+    tags: iterable of str
+        Tags, e.g. ``["B-PER", "I-PER", "O"]``, or ``["B", "I", "O"]``.
+    sep: str
+        The separator between the prefix and the type of a tag.
+
+    Returns
+    --------
+    prefixes: :py:class:`numpy.ndarray`
+        The codes of the prefixes, one of :data:`TAG_O`, :data:`TAG_B`,
+        :data:`TAG_I`, :data:`TAG_L`, :data:`TAG_U`, or -1 if the prefix is
+        not valid.
+    types: :py:class:`numpy.ndarray`
+        The index of the type of each tag in ``labels``.
+    labels: list of str
+        The types. The first is ``""``, for tags without a type.
+
+    """
+    tags = np.asarray(list(tags), dtype=str)
+    # only the distinct tags are parsed
+    unique, inverse = np.unique(tags, return_inverse=True)
+    unique_prefixes = np.empty(len(unique), dtype=np.int8)
+    unique_types = np.empty(len(unique), dtype=np.int32)
+    label_ids = {"": 0}
+    for j, tag in enumerate(unique.tolist()):
+        prefix, _, label = tag.partition(sep)
+        unique_prefixes[j] = _TAG_CODES.get(prefix, -1)
+        unique_types[j] = label_ids.setdefault(label, len(label_ids))
+    inverse = inverse.reshape(-1)
+    return unique_prefixes[inverse], unique_types[inverse], list(label_ids)
+
+
+def decode_tags(prefixes, types=None, labels=None, sep="-"):
+    """ Decode integer arrays of tags to strings
+
+    This is the inverse of :func:`encode_tags`.
+
+    Parameters
+    -----------
+    prefixes: array of int
+        The codes of the prefixes of the tags.
+    types: array of int, optional
+        The index of the type of each tag in ``labels``. If ``None``, the
+        tags do not have types.
+    labels: list of str, optional
+        The types.
+    sep: str
+        The separator between the prefix and the type of a tag.
+
+    Returns
+    --------
+    list of str
+        The tags. Tags with an invalid prefix, e.g. -1, are ``None``.
+
+    """
+    prefixes = np.asarray(prefixes, dtype=np.int64)
+    if types is None:
+        types = np.zeros(len(prefixes), dtype=np.int64)
+        labels = [""]
+    types = np.asarray(types, dtype=np.int64)
+    # only the distinct pairs of prefix and type are decoded
+    pairs = (prefixes + 1) * len(labels) + types
+    unique, inverse = np.unique(pairs, return_inverse=True)
+    names = []
+    for pair in unique.tolist():
+        code, label = divmod(pair, len(labels))
+        code -= 1
+        if not 0 <= code < len(_TAG_PREFIXES):
+            names.append(None)
+        elif code == TAG_O or not labels[label]:
+            names.append(_TAG_PREFIXES[code])
+        else:
+            names.append(f"{_TAG_PREFIXES[code]}{sep}{labels[label]}")
+    return [names[i] for i in inverse.reshape(-1).tolist()]
+
+
+def _tag_context(prefixes, types, offsets):
+    """ Return the masks used to compare each tag with the previous one
+
+    Returns a boolean array which is ``True`` if a tag can continue the
+    entity of the previous tag, i.e. it is not the first tag of a sentence
+    and has the same type as the previous tag.
+
+    """
+    n = len(prefixes)
+    linked = np.ones(n, dtype=bool)
+    if n:
+        linked[0] = False
+    if offsets is not None:
+        starts = np.asarray(offsets, dtype=np.int64)[:-1]
+        linked[starts[starts < n]] = False
+    if types is not None:
+        types = np.asarray(types)
+        linked[1:] &= types[1:] == types[:-1]
+    return linked
+
+
+def _shift_back(mask):
+    """ Return ``mask[i + 1]`` at each position, and ``False`` at the end """
+    out = np.zeros_like(mask)
+    out[:-1] = mask[1:]
+    return out
+
+
+def _shift_forward(mask):
+    """ Return ``mask[i - 1]`` at each position, and ``False`` at the start """
+    out = np.zeros_like(mask)
+    out[1:] = mask[:-1]
+    return out
+
+
+def bio2biolu_array(prefixes, types=None, offsets=None, strict=False):
+    """ Convert BIO tags to BILOU tags
+
+    This is the same conversion as :func:`bio2biolu`, for integer encoded
+    tags of a sentence or of many sentences.
+
+    Invalid tags are not an error. An ``I`` that does not continue an
+    entity, because it follows an ``O``, a tag with a different type, or
+    starts a sentence, begins a new entity, as if it were a ``B``. Tags
+    with prefixes other than ``B``, ``I``, or ``O`` are treated as ``O``.
+    Their positions are returned in ``errors``.
+
+    Parameters
+    -----------
+    prefixes: array of int
+        The codes of the prefixes of the tags, e.g. from
+        :func:`encode_tags`.
+    types: array, optional
+        The types of the tags. Entities only continue over tags with the
+        same type. If ``None``, tags do not have types.
+    offsets: array of int, optional
+        The offsets of the sentences, such that sentence ``i`` is
+        ``prefixes[offsets[i]:offsets[i + 1]]``. Entities do not continue
+        across sentences. If ``None``, the tags are one sentence.
+    strict: bool
+        If ``True``, the converted tags of invalid tags are -1 instead.
+
+    Returns
+    --------
+    out: :py:class:`numpy.ndarray`
+        The codes of the BILOU prefixes. The types are unchanged.
+    errors: :py:class:`numpy.ndarray`
+        The positions of invalid tags.
+
+    """
+    prefixes = np.asarray(prefixes)
+    linked = _tag_context(prefixes, types, offsets)
+    is_b = prefixes == TAG_B
+    is_i = prefixes == TAG_I
+    # an I continues an entity if the previous tag is in one
+    inside = _shift_forward(is_b | is_i)
+    cont = is_i & inside & linked
+    bad_i = is_i & ~cont
+    begin = is_b | bad_i
+    next_cont = _shift_back(cont)
+    out = np.full(len(prefixes), TAG_O, dtype=np.int8)
+    out[begin & next_cont] = TAG_B
+    out[begin & ~next_cont] = TAG_U
+    out[cont & next_cont] = TAG_I
+    out[cont & ~next_cont] = TAG_L
+    invalid = ~(is_b | is_i | (prefixes == TAG_O))
+    errors = np.flatnonzero(bad_i | invalid)
+    if strict:
+        out[errors] = -1
+    return out, errors
+
+
+def biolu2bio_array(prefixes, types=None, offsets=None, strict=False):
+    """ Convert BILOU tags to BIO tags
+
+    This is the same conversion as :func:`biolu2bio`, for integer encoded
+    tags of a sentence or of many sentences.
+
+    Invalid tags are not an error. An ``I`` or ``L`` that does not continue
+    an entity begins a new entity, as if it were a ``B``. A ``B`` or ``I``
+    that is not followed by an ``I`` or ``L`` ends its entity. Tags with
+    other prefixes are treated as ``O``. Their positions are returned in
+    ``errors``.
+
+    Parameters
+    -----------
+    prefixes: array of int
+        The codes of the prefixes of the tags, e.g. from
+        :func:`encode_tags`.
+    types: array, optional
+        The types of the tags. Entities only continue over tags with the
+        same type. If ``None``, tags do not have types.
+    offsets: array of int, optional
+        The offsets of the sentences, such that sentence ``i`` is
+        ``prefixes[offsets[i]:offsets[i + 1]]``. Entities do not continue
+        across sentences. If ``None``, the tags are one sentence.
+    strict: bool
+        If ``True``, the converted tags of invalid tags are -1 instead.
+
+    Returns
+    --------
+    out: :py:class:`numpy.ndarray`
+        The codes of the BIO prefixes. The types are unchanged.
+    errors: :py:class:`numpy.ndarray`
+        The positions of invalid tags.
+
+    """
+    prefixes = np.asarray(prefixes)
+    linked = _tag_context(prefixes, types, offsets)
+    is_b = prefixes == TAG_B
+    is_i = prefixes == TAG_I
+    is_l = prefixes == TAG_L
+    is_u = prefixes == TAG_U
+    # B and I open an entity, which the next I or L continues
+    opened = is_b | is_i
+    cont = (is_i | is_l) & _shift_forward(opened) & linked
+    bad_cont = (is_i | is_l) & ~cont
+    dangling = opened & ~_shift_back(cont)
+    out = np.full(len(prefixes), TAG_O, dtype=np.int8)
+    out[is_b | is_u | bad_cont] = TAG_B
+    out[cont] = TAG_I
+    invalid = ~(opened | is_l | is_u | (prefixes == TAG_O))
+    errors = np.flatnonzero(bad_cont | dangling | invalid)
+    if strict:
+        out[errors] = -1
+    return out, errors